@@ -0,0 +1,18 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+from pathlib import Path
+
+def cache_dir() -> Path:
+    """The per-user directory p4submodule keeps its caches in"""
+    if override := os.environ.get('P4SUBMODULE_CACHE_DIR'):
+        return Path(override).expanduser()
+
+    if os.name == 'nt':
+        base = Path(os.environ.get('LOCALAPPDATA', '~/AppData/Local'))
+    else:
+        base = Path(os.environ.get('XDG_CACHE_HOME', '~/.cache'))
+
+    return base.expanduser() / 'p4submodule'
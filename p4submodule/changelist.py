@@ -0,0 +1,225 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import time
+from typing import NamedTuple, Optional, TYPE_CHECKING
+
+import P4 # type: ignore
+
+from .p4_context import P4Context, p4_escape, p4_unescape
+from .profiling import profiler
+
+if TYPE_CHECKING:
+    from .config_file import ConfigFile
+
+CONNECTION_ERRORS = ('TCP', 'RpcTransport', 'Partner exited unexpectedly', 'Connect to server failed', 'timed out', 'Broken pipe', 'Connection reset')
+"""Parts of the messages P4 reports when a command fails because the connection was lost, which are worth retrying"""
+
+class FileChanges(object):
+    """
+    The files that need to be opened in P4 for a change to the workspace, as workspace-syntax paths
+    """
+
+    edits: dict[str, None]
+    """Files to open for edit before they are written"""
+
+    moves: dict[str, str]
+    """Files to move from the key to the value (the source is opened for edit first)"""
+
+    deletes: dict[str, None]
+    """Files to open for delete"""
+
+    adds: dict[str, None]
+    """Files to open for add once they exist"""
+
+    def __init__(self) -> None:
+        self.edits = {}
+        self.moves = {}
+        self.deletes = {}
+        self.adds = {}
+
+    def __len__(self) -> int:
+        return len(self.edits) + len(self.moves) + len(self.deletes) + len(self.adds)
+
+    def extend(self, other: FileChanges) -> None:
+        self.edits.update(other.edits)
+        self.moves.update(other.moves)
+        self.deletes.update(other.deletes)
+        self.adds.update(other.adds)
+
+class Submitted(NamedTuple):
+    """The outcome of submitting a changelist"""
+    change: int
+    """The number the changelist was submitted as (the server renumbers changelists when they're submitted after newer ones)"""
+    files: int
+    size: Optional[int]
+    """The total size of the submitted files in bytes, if the server reported it"""
+    seconds: float
+    attempts: int
+
+class Changelist(object):
+    """
+    A changelist that p4submodule opens files in, which can be rolled back if something goes wrong
+    """
+
+    p4: P4Context
+
+    number: int
+
+    created: bool
+    """Whether the changelist was created by p4submodule (and should be deleted on rollback)"""
+
+    opened: dict[str, None]
+    """Every file opened in the changelist so far (other than the ones that already were, see _preopened)"""
+
+    _configs: dict[str, None]
+    """The config files opened by save_configs, which rollback restores from the depot"""
+
+    _preopened: Optional[set[str]]
+    """The files that were already opened in the changelist before p4submodule used it, which are never reverted"""
+
+    RETRY_DELAY = 2.0
+    """Seconds to wait before retrying a submit that lost its connection, doubled for each further attempt"""
+
+    def __init__(self, p4: P4Context, number: int, created: bool = False) -> None:
+        self.p4 = p4
+        self.number = number
+        self.created = created
+        self.opened = {}
+        self._configs = {}
+        self._preopened = set() if created else None
+
+    @staticmethod
+    def create(p4: P4Context, description: str) -> Changelist:
+        change = p4.fetch_change()
+        change._description = description
+        return Changelist(p4, p4.save_change(change), created=True)
+
+    def open(self, changes: FileChanges) -> None:
+        """Open the files that need to be writable before the workspace is updated, in as few commands as possible"""
+        args = ['-c', str(self.number)]
+        with self.p4.lock, profiler.phase('p4 open', files=len(changes)):
+            self.p4.run_batched('edit', args, (p4_escape(path) for path in self._track([*changes.edits, *changes.moves])))
+
+            # The workspace is only written by git (see Submodule.apply_update), so P4 leaves the files where they are
+            for source, destination in changes.moves.items():
+                self.p4.run_move('-k', *args, p4_escape(source), p4_escape(destination))
+                self._track([destination])
+
+            self.p4.run_batched('delete', ['-k', *args], (p4_escape(path) for path in self._track(changes.deletes)))
+
+    def add(self, changes: FileChanges) -> None:
+        """Open the files that have been created by the workspace update"""
+        with self.p4.lock, profiler.phase('p4 add', files=len(changes.adds)):
+            self.p4.run_batched('add', ['-c', str(self.number), '-I', '-f'], self._track(changes.adds))
+
+    def save_configs(self, configs: list[ConfigFile]) -> None:
+        """Write config files, opening them in the changelist"""
+        existing = [str(config.file_ws) for config in configs if not config.is_new]
+        new = [str(config.file_ws) for config in configs if config.is_new]
+
+        with self.p4.lock, profiler.phase('save configs', files=len(configs)):
+            self.p4.run_batched('edit', ['-c', str(self.number)], (p4_escape(path) for path in self._track(existing, self._configs)))
+
+            for config in configs:
+                config.write_document()
+
+            self.p4.run_batched('add', ['-c', str(self.number), '-I', '-f'], self._track(new, self._configs))
+
+    def rollback(self) -> None:
+        """
+        Revert the files p4submodule opened in the changelist, and delete it if it was created.
+
+        Submodule files are left as they are, since rolling back the git side (see Submodule.rollback_update) already restored
+        them, local changes included. Config files are restored from the depot.
+        """
+        with self.p4.lock, profiler.phase('p4 revert', files=len(self.opened)):
+            files = (p4_escape(path) for path in self.opened if path not in self._configs)
+            self.p4.run_batched('revert', ['-k', '-c', str(self.number)], files)
+            self.p4.run_batched('revert', ['-w', '-c', str(self.number)], (p4_escape(path) for path in self._configs))
+            self.opened.clear()
+            self._configs.clear()
+
+            if self.created:
+                self.p4.delete_change(self.number)
+
+    def submit(self, threads: int = 1, batch: Optional[int] = None, retries: int = 2) -> Submitted:
+        """
+        Submit the changelist, transferring its files over up to threads connections, batch files at a time (see `p4 help submit`).
+
+        Submits that fail because the connection was lost are retried up to retries times, unless the server turns out to have
+        completed the submit anyway.
+        """
+        args = ['-c', str(self.number)]
+        if threads > 1:
+            args.insert(0, f'--parallel=threads={threads}' + (f',batch={batch}' if batch else ''))
+
+        start = time.perf_counter()
+        attempts = 0
+        with profiler.phase('p4 submit', change=self.number, threads=threads):
+            while True:
+                attempts += 1
+                try:
+                    results = self.p4.run('submit', *args)
+                    change = next(int(result['submittedChange']) for result in results if 'submittedChange' in result)
+                    files = sum(1 for result in results if 'depotFile' in result)
+                    break
+                except P4.P4Exception as e:
+                    if attempts > retries or not self._lost_connection(e):
+                        raise
+
+                    delay = Changelist.RETRY_DELAY * 2 ** (attempts - 1)
+                    print(f"Submitting CL {self.number} lost the connection to the server, retrying in {delay:.0f}s: {str(e).strip().splitlines()[-1].strip()}")
+                    time.sleep(delay)
+
+                    # The connection may have dropped after the server finished the submit
+                    if description := self._submitted_description():
+                        change = int(description['change'])
+                        files = len(description.get('depotFile', []))
+                        break
+
+            seconds = time.perf_counter() - start
+
+        profiler.count('files submitted', files)
+        return Submitted(change, files, self._submitted_size(change), seconds, attempts)
+
+    def _lost_connection(self, error: P4.P4Exception) -> bool:
+        if self.p4.connected() and not any(marker in str(error) for marker in CONNECTION_ERRORS):
+            return False
+        # The next command connects again (see P4Context.run)
+        if self.p4.connected():
+            self.p4.disconnect()
+        return True
+
+    def _submitted_description(self) -> Optional[dict]:
+        """The description of the changelist if it has been submitted, looked up by its original number in case it was renumbered"""
+        try:
+            description = self.p4.run('describe', '-s', '-O', str(self.number))[0]
+        except P4.P4Exception:
+            return None
+        return description if description.get('status') == 'submitted' else None
+
+    def _submitted_size(self, change: int) -> Optional[int]:
+        try:
+            with self.p4.lock, self.p4.at_exception_level(P4.P4.RAISE_ERRORS):
+                results = self.p4.run('sizes', '-s', f'//...@={change}')
+        except P4.P4Exception:
+            return None
+        return sum(int(result['fileSize']) for result in results if 'fileSize' in result) if results else None
+
+    def _track(self, paths: list[str] | dict[str, None], *into: dict[str, None]) -> list[str]:
+        """Record paths as opened by p4submodule (in self.opened and into), unless they already were opened in the changelist"""
+        paths = list(paths)
+        if self._preopened is None:
+            with self.p4.at_exception_level(P4.P4.RAISE_ERRORS):
+                # Having nothing opened is only a warning
+                results = self.p4.run_opened('-c', str(self.number))
+            self._preopened = {p4_unescape(result['clientFile']) for result in results}
+
+        tracked = dict.fromkeys(path for path in paths if path not in self._preopened)
+        for opened in (self.opened, *into):
+            opened.update(tracked)
+        return paths
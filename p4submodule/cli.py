@@ -2,20 +2,28 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-import glob
-import re
+from __future__ import annotations
+
+import json
 import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional, TYPE_CHECKING
 from urllib.parse import urlparse
 
 import click
 
-from .config_file import ConfigFile
-from .p4_context import P4Context
+from .discovery import SOURCES, discover_configs
+from .parallel import HostLimiter
+from .profiling import profiler
 
-# Replace git@github.com:org/repo.git with ssh://git@github.com/org/repo.git
-GIT_SSH_REGEX = re.compile(R"([\w\.]+)@([\w\.]+):([\w\.@\:/\-~]+)")
+# Commands import the modules they use themselves, so --help and commands that don't need them never load P4, pygit2 or tomlkit
+if TYPE_CHECKING:
+    from .changelist import Changelist, FileChanges
+    from .config_file import ConfigFile
+    from .p4_context import P4Context
+    from .submodule import PendingUpdate, Submodule
 
 
 def config_argument(*param_decls: str):
@@ -29,14 +37,12 @@ def config_argument(*param_decls: str):
             if not ctx:
                 raise Exception("ctx must be set!")
 
+            from .config_file import ConfigFile
+
             if not isinstance(value, Path):
                 value = Path(value)
 
-            p4 = ctx.find_object(P4Context)
-            if not p4:
-                ctx.fail("internal error: p4 object must be set!")
-
-            return ConfigFile(value, p4)
+            return ConfigFile(value, _p4(ctx))
 
     return click.argument(
         *param_decls,
@@ -46,6 +52,36 @@ def config_argument(*param_decls: str):
         metavar="[PATH TO submodule.toml]",
     )
 
+def _discover_configs(configs: list[str], p4: P4Context, source: str) -> list[ConfigFile]:
+    """Expand the config arguments of a command into the config files they match"""
+    from .config_file import ConfigFile
+    return [ConfigFile(config_file, p4) for config_file in discover_configs(configs, p4, source)]
+
+discover_option = click.option('--discover', type=click.Choice(SOURCES), default='glob', show_default=True, help="How to find config files: walk the filesystem (glob), ask the P4 server (p4), or use a cached index of the filesystem (index)")
+
+tags_option = click.option('--tags', type=bool, is_flag=True, help="Also fetch the remote's tags that point into the tracking branch's history (used to annotate current_ref with `git describe`)")
+
+def submit_options(command):
+    """The options controlling how changelists are submitted"""
+    command = click.option('--submit-retries', type=click.IntRange(min=0), default=2, help="The number of times to retry a submit that lost its connection to the server")(command)
+    command = click.option('--submit-batch', type=click.IntRange(min=1), help="(Defaults to the server's setting) The number of files each parallel submit thread sends at a time")(command)
+    command = click.option('--submit-threads', type=click.IntRange(min=1), default=8, help="The number of threads transferring files when submitting (limited by the server's net.parallel.max)")(command)
+    return command
+
+def _submit(change: Changelist, threads: int, batch: Optional[int], retries: int) -> None:
+    """Submit a changelist, reporting how fast the files were transferred"""
+    try:
+        result = change.submit(threads, batch, retries)
+    except Exception as e:
+        raise click.ClickException(f"Failed to submit CL {change.number}, its files are still opened (retry with `p4submodule submit {change.number}`): {e}")
+
+    renumbered = f" as CL {result.change}" if result.change != change.number else ""
+    size = f" ({result.size / 1024 / 1024:.1f} MiB)" if result.size is not None else ""
+    rate = f"{result.files / max(result.seconds, 0.001):.0f} files/s"
+    if result.size is not None:
+        rate += f", {result.size / 1024 / 1024 / max(result.seconds, 0.001):.1f} MiB/s"
+    print(f"Submitted CL {change.number}{renumbered}: {result.files} files{size} in {result.seconds:.1f}s ({rate})")
+
 changelist_option = click.option('-c', '--changelist', type=int, metavar="CHANGELIST", help="(Defaults to creating a new CL) The P4 changelist to place changes in")
 
 @click.group()
@@ -53,44 +89,105 @@ changelist_option = click.option('-c', '--changelist', type=int, metavar="CHANGE
 @click.option('--p4-port', type=str, help="P4 server address to use intead of inferring from `p4 set`")
 @click.option('--p4-user', type=str, help="P4 username to use intead of inferring from `p4 set`")
 @click.option('--p4-client', type=str, help="P4 workspace to use intead of inferring from `p4 set`")
-def main(ctx: click.Context, p4_port: str, p4_user: str, p4_client: str):
+@click.option('--p4-connections', type=click.IntRange(min=1), default=4, help="The number of P4 connections to use for commands operating on large numbers of files")
+@click.option('--mirror-dir', type=click.Path(file_okay=False, path_type=Path), envvar='P4SUBMODULE_MIRROR_DIR', help="A directory of shared mirrors to fetch remotes through, instead of each submodule downloading its own copy (or set P4SUBMODULE_MIRROR_DIR). Mirrors fetch full history, whatever the submodules' depth")
+@click.option('--no-lfs', type=bool, is_flag=True, help="Don't download git LFS objects, leaving the files tracked by LFS as pointers (submodules can also set `lfs = false`)")
+@click.option('--lfs-jobs', type=click.IntRange(min=1), default=8, help="The number of git LFS objects to download at once")
+@click.option('--profile', type=bool, is_flag=True, help="Print a table of the time spent in each phase of the run (fetches, checkouts, P4 commands...) and counts of bytes, objects and files")
+@click.option('--trace', type=click.Path(dir_okay=False, path_type=Path), help="Write the phases of the run to a Chrome trace file (open it in chrome://tracing or https://ui.perfetto.dev)")
+def main(ctx: click.Context, p4_port: str, p4_user: str, p4_client: str, p4_connections: int, mirror_dir: Optional[Path], no_lfs: bool, lfs_jobs: int, profile: bool, trace: Optional[Path]):
     """A tool for managing git repositories inside of Perforce depots."""
 
-    p4 = P4Context()
+    # The connection is only created by the commands that use it, see _p4
+    ctx.meta['p4_settings'] = (p4_port, p4_user, p4_client, p4_connections)
 
-    if p4_port:
-        p4.port = p4_port
-    if p4_user:
-        p4.user = p4_user
-    if p4_client:
-        p4.client = p4_client
+    ctx.meta['mirror'] = None
+    if mirror_dir:
+        from .mirror import MirrorCache
+        ctx.meta['mirror'] = MirrorCache(mirror_dir)
+    ctx.meta['lfs'] = not no_lfs
+    ctx.meta['lfs_jobs'] = lfs_jobs
 
-    ctx.obj = ctx.with_resource(p4)
+    if profile or trace:
+        profiler.enabled = True
+        # Reported when the command finishes, even if it fails
+        ctx.call_on_close(lambda: _report_profile(profile, trace))
+
+def _p4(ctx: click.Context) -> P4Context:
+    """The P4 connection for the run, created on first use (it connects to the server when it runs its first command)"""
+    if 'p4' not in ctx.meta:
+        from .p4_context import P4Context
+
+        p4_port, p4_user, p4_client, p4_connections = ctx.meta['p4_settings']
+
+        # Callers embedding the CLI may pass their own connection as obj
+        root = ctx.find_root()
+        p4 = root.obj if isinstance(root.obj, P4Context) else P4Context()
+
+        if p4_port:
+            p4.port = p4_port
+        if p4_user:
+            p4.user = p4_user
+        if p4_client:
+            p4.client = p4_client
+
+        p4.connections = p4_connections
+
+        ctx.meta['p4'] = root.with_resource(p4)
+    return ctx.meta['p4']
+
+def _report_profile(profile: bool, trace: Optional[Path]) -> None:
+    if profile:
+        print(profiler.summary())
+    if trace:
+        profiler.write_trace(trace)
+        print(f"Wrote trace to {trace}")
 
 @main.command(hidden=True)
 @config_argument('config')
 def dump_config(config: ConfigFile):
+    from .submodule import Submodule
     for module in config.submodules:
-        print(f'{module}: {vars(module)}')
+        print(f'{module}: { {slot: getattr(module, slot, None) for slot in Submodule.__slots__} }')  # pytype: disable=attribute-error
 
 @main.command()
+@click.pass_context
 @config_argument('config')
 @click.option('--name', type=str, metavar="NAME", help="(defaults to the checkout directory name) A name used to refer to the submodule", show_default=False)
 @click.option('--remote', type=str, prompt=True, metavar="URL", help="The URL for the remote repository to track")
 @click.option('--tracking', type=str, metavar="BRANCH", help="The branch to track from the remote")
 @click.option('--path', type=Path, help="The optional relative path from the config file to the checkout directory")
+@click.option('--depth', type=click.IntRange(min=1), help="Only fetch this many commits of history (more history is fetched when an update needs it)")
+@click.option('--include', type=str, multiple=True, metavar="PATTERN", help="Only check out and add to P4 the files matching this pattern (may be repeated)")
+@click.option('--exclude', type=str, multiple=True, metavar="PATTERN", help="Leave the files matching this pattern out of the working tree and P4 (may be repeated)")
 @click.option('--no-sync', type=bool, is_flag=True, help="Create the submodule config file, but don't clone it")
+@click.option('--submit', type=bool, is_flag=True, help="Submit the CL once the submodule has been added")
+@submit_options
+@tags_option
 @changelist_option
-def create(config: ConfigFile, name: Optional[str], remote: str, tracking: Optional[str], path: Optional[Path], no_sync: bool, changelist: Optional[int]):
+def create(ctx: click.Context, config: ConfigFile, name: Optional[str], remote: str, tracking: Optional[str], path: Optional[Path], depth: Optional[int],
+           include: tuple[str, ...], exclude: tuple[str, ...], no_sync: bool, submit: bool, submit_threads: int, submit_batch: Optional[int], submit_retries: int,
+           tags: bool, changelist: Optional[int]):
     """Creates a new submodule."""
+    from .changelist import Changelist
+    from .mirror import normalize_remote_url
+    from .submodule import FetchOptions
 
     new = config.add_submodule(name, path, name is None)
 
-    if match := GIT_SSH_REGEX.match(remote):
-        remote = "ssh://{}@{}/{}".format(*match.groups())
+    remote = normalize_remote_url(remote)
 
     new.remote = urlparse(remote)
 
+    if depth:
+        new.depth = depth
+
+    if include:
+        new.include = list(include)
+
+    if exclude:
+        new.exclude = list(exclude)
+
     if tracking:
         new.tracking = tracking
     elif no_sync:
@@ -109,45 +206,315 @@ def create(config: ConfigFile, name: Optional[str], remote: str, tracking: Optio
         change_number = config.p4.save_change(change)
 
     if not no_sync:
-        _ = new.clone(change_number)
+        _ = new.clone(change_number, FetchOptions(mirror=ctx.meta['mirror'], tags=tags, lfs=ctx.meta['lfs'], lfs_jobs=ctx.meta['lfs_jobs']))
 
     config.save(change_number)
 
     print(f"Added submodule {new.name} in CL {change_number}")
 
+    if submit:
+        _submit(Changelist(config.p4, change_number), submit_threads, submit_batch, submit_retries)
+
 @main.command()
 @click.pass_context
 @click.argument('configs', type=str, nargs=-1)
 @click.option('-m', '--message', type=str, default="[p4submodule] updating repo", help="The commit message to use when converting local changes to the target repository type")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1, help="The number of submodules to update at once")
+@click.option('--jobs-per-host', type=click.IntRange(min=1), default=4, help="The number of submodules to fetch at once from any one host (when --jobs is greater than 1)")
+@click.option('--single-changelist', type=bool, is_flag=True, help="Place the changes to every config in one new CL, instead of one CL per config")
+@click.option('--full-scan', type=bool, is_flag=True, help="Check every file for local changes, instead of only the files opened in P4 (for files made writable without opening them). Every file is checked anyway when a submodule's repository is new, or its files have been synced since the last update")
+@click.option('--from-cache', type=bool, is_flag=True, help="Update to what `prefetch` last fetched, without any network access")
+@click.option('--submit', type=bool, is_flag=True, help="Submit the CLs once every submodule has been updated")
+@submit_options
+@tags_option
+@discover_option
 @changelist_option
-def update(ctx: click.Context, configs: list[str], message: Optional[str], changelist: Optional[int]):
+def update(ctx: click.Context, configs: list[str], message: Optional[str], jobs: int, jobs_per_host: int, single_changelist: bool, full_scan: bool, from_cache: bool,
+           submit: bool, submit_threads: int, submit_batch: Optional[int], submit_retries: int, tags: bool, discover: str, changelist: Optional[int]):
     """
     Fetch & update submodules in config to the latest revision of their tracking branches.
 
     This command will do it's best to preserve your local/p4 changes to directories by commiting them to the local git repository,
     fetching the remote, and rebasing your change on top of the newest tracking version, but it is possible that conflicts may arise.
+    Local commits are rebased in memory, so conflicts are reported before the working tree is touched or anything is opened in P4.
+
+    Every submodule is fetched and planned before anything is opened in P4, and CLs are only created for configs with changes.
+    If anything fails, the files opened in P4 are reverted and the submodules are restored to how they were.
     """
-    p4 = ctx.find_object(P4Context)
+    from .changelist import Changelist, FileChanges
+    from .config_file import ConfigFile
+    from .submodule import FetchOptions
+
+    p4 = _p4(ctx)
+
+    options = FetchOptions(
+        show_progress=jobs == 1,
+        host_limiter=HostLimiter(jobs_per_host if jobs > 1 else None),
+        mirror=ctx.meta['mirror'],
+        tags=tags,
+        lfs=ctx.meta['lfs'],
+        lfs_jobs=ctx.meta['lfs_jobs'],
+        from_cache=from_cache,
+    )
 
-    for config_entry in configs:
-        if not config_entry.endswith("submodule.toml"):
-            config_entry = config_entry + "/submodule.toml"
+    prepared: list[tuple[Submodule, PendingUpdate]] = []
+    changelists: dict[Changelist, tuple[list[ConfigFile], FileChanges]] = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        try:
+            config_files = _discover_configs(configs, p4, discover)
+
+            # Fetch and plan every submodule before anything is opened in P4
+            plans = [
+                (config, module, executor.submit(module.prepare_update, commit_message=message, options=options, full_scan=full_scan))
+                for config in config_files
+                for module in config.submodules
+            ]
+
+            # Wait for all of them, so every prepared submodule can be rolled back if one of them failed
+            wait([future for _, _, future in plans])
+            stale: dict[ConfigFile, list[PendingUpdate]] = {}
+            for config, module, future in plans:
+                if not future.exception() and (pending := future.result()):
+                    prepared.append((module, pending))
+                    stale.setdefault(config, []).append(pending)
+            failed = [(module, error) for _, module, future in plans if (error := future.exception())]
+            for module, error in failed:
+                print(f"[{module.name}] Failed to update: {error}")
+            if failed:
+                raise click.ClickException(f"Failed to update {len(failed)} of {len(plans)} submodules")
+
+            # Look up the depot paths needed for CL descriptions at once instead of once per config
+            ConfigFile.look_up_depot_paths(list(stale))
+
+            shared: Optional[Changelist] = None
+            if changelist:
+                shared = Changelist(p4, changelist)
+            elif single_changelist and stale:
+                depot_paths = '\n'.join(str(config.directory_depot) for config in stale)
+                shared = Changelist.create(p4, f"Update submodules in {len(stale)} config{'s' if len(stale) > 1 else ''}\n\n{depot_paths}")
+
+            for config, pendings in stale.items():
+                change = shared or Changelist.create(p4, textwrap.dedent(f"""
+                Update submodule{'s' if len(config.submodules) > 1 else ''} in {config.directory_depot}
+                """).strip())
+                config_list, changes = changelists.setdefault(change, ([], FileChanges()))
+                config_list.append(config)
+                for pending in pendings:
+                    changes.extend(pending.changes)
+
+            # Everything that has to be writable is opened in as few commands as possible
+            for change, (_, changes) in changelists.items():
+                change.open(changes)
+
+            # The git side of each submodule runs in parallel
+            applied = [executor.submit(module.apply_update, pending) for module, pending in prepared]
+            wait(applied)
+            for future in applied:
+                future.result()
+
+            for change, (config_list, changes) in changelists.items():
+                change.add(changes)
+                change.save_configs(config_list)
+                for config in config_list:
+                    print(f"Updated submodules in {config.directory} in CL {change.number}")
+
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+
+            for module, pending in prepared:
+                try:
+                    module.rollback_update(pending)
+                except Exception as e:
+                    print(f"[{module.name}] Failed to roll back: {e}")
+
+            for change in changelists:
+                change.rollback()
+
+            raise
+
+    # Remember what was learned about the remotes, so later runs (and status --offline) can use it
+    for config in config_files:
+        config.save_state()
+
+    if p4.round_trips_saved:
+        print(f"Saved {p4.round_trips_saved} P4 round trips with cached server metadata")
+
+    # A failed submit leaves the update in place, with the files still opened
+    if submit:
+        for change in changelists:
+            _submit(change, submit_threads, submit_batch, submit_retries)
 
-        for config_file in glob.iglob(f"{config_entry}", recursive=True):
-            config = ConfigFile(Path(config_file), p4)
+@main.command()
+@click.pass_context
+@click.argument('configs', type=str, nargs=-1)
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=8, help="The number of remotes to query at once")
+@click.option('--jobs-per-host', type=click.IntRange(min=1), default=4, help="The number of remotes to query at once on any one host")
+@click.option('--json', 'as_json', type=bool, is_flag=True, help="Print the results as JSON instead of a table")
+@click.option('--offline', type=bool, is_flag=True, help="Compare against the remote heads seen by previous runs instead of querying the remotes")
+@discover_option
+def status(ctx: click.Context, configs: list[str], jobs: int, jobs_per_host: int, as_json: bool, offline: bool, discover: str):
+    """
+    Show which submodules are behind their tracking branches.
 
-            if not changelist:
-                change = p4.fetch_change()
-                change._description = textwrap.dedent(f"""
-                Update submodule{'s' if len(config.submodules) > 1 else ''} in {config.directory_depot}
-                """).strip()
-                change_number = p4.save_change(change)
+    Only the remotes' advertised refs are queried, nothing is fetched and no changes are made in git or P4.
+    Exits with status 1 if any submodule couldn't be checked.
+    """
+    from .submodule import FetchOptions
+
+    p4 = _p4(ctx)
+
+    options = FetchOptions(show_progress=False, host_limiter=HostLimiter(jobs_per_host))
+
+    def _status(module: Submodule) -> dict[str, Any]:
+        try:
+            return module.status(options, offline)
+        except Exception as e:
+            return {'name': module.name, 'path': str(module.local_path), 'error': str(e)}
+
+    config_files = _discover_configs(configs, p4, discover)
+    modules = [module for config in config_files for module in config.submodules]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(_status, modules))
+
+    # Remember the remote heads that were seen
+    for config in config_files:
+        config.save_state()
+
+    if as_json:
+        print(json.dumps(results, indent=2))
+
+    else:
+        _print_status(results)
+
+    # Let pollers notice failing remotes without parsing the output
+    if any('error' in result for result in results):
+        ctx.exit(1)
+
+def _print_status(results: list[dict[str, Any]]) -> None:
+    for result in results:
+        if 'error' in result:
+            state = f"error: {result['error']}"
+        elif result['up_to_date']:
+            state = "up to date"
+        elif result['behind'] is not None:
+            state = f"{result['behind']} commits behind"
+        else:
+            state = "behind"
+
+        current = result.get('current_describe') or (result.get('current_ref') or '')[:10]
+        remote = result.get('remote_describe') or (result.get('remote_head') or '')[:10]
+        print(f"{result['name']:<24} {current:<24} {remote:<24} {state}")
+
+@main.command()
+@click.pass_context
+@click.argument('configs', type=str, nargs=-1)
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=8, help="The number of remotes to fetch at once")
+@click.option('--jobs-per-host', type=click.IntRange(min=1), default=4, help="The number of remotes to fetch at once from any one host")
+@tags_option
+@discover_option
+def prefetch(ctx: click.Context, configs: list[str], jobs: int, jobs_per_host: int, tags: bool, discover: str):
+    """
+    Fetch the tracking branches of submodules (and the LFS objects updating to them needs) without updating anything.
+
+    Nothing is changed in the working tree or P4, so this can run on a schedule. A later `update --from-cache` then only does local git and P4 work.
+    """
+    from .submodule import FetchOptions
+
+    p4 = _p4(ctx)
+
+    options = FetchOptions(
+        show_progress=False,
+        host_limiter=HostLimiter(jobs_per_host),
+        mirror=ctx.meta['mirror'],
+        tags=tags,
+        lfs=ctx.meta['lfs'],
+        lfs_jobs=ctx.meta['lfs_jobs'],
+    )
+
+    def _prefetch(module: Submodule) -> bool:
+        try:
+            if target := module.prefetch(options):
+                print(f"[{module.name}] Fetched {module.tracking} ({target})")
             else:
-                change_number = changelist
-
-            for module in config.submodules:
-                if module.update(change_number=change_number, commit_message=message):
-                    config.save(change_number)
-                    print(f"Updated submodules in {config.directory} in CL {change_number}")
-                elif not changelist:
-                    p4.delete_change(change_number)
+                print(f"[{module.name}] Up to date!")
+            return True
+        except Exception as e:
+            print(f"[{module.name}] Failed to prefetch: {e}")
+            return False
+
+    config_files = _discover_configs(configs, p4, discover)
+    modules = [module for config in config_files for module in config.submodules]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(_prefetch, modules))
+
+    # Remember when each remote was fetched
+    for config in config_files:
+        config.save_state()
+
+    if failed := results.count(False):
+        raise click.ClickException(f"Failed to prefetch {failed} of {len(modules)} submodules")
+
+@main.command()
+@click.pass_context
+@click.argument('configs', type=str, nargs=-1)
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=8, help="The number of threads hashing files")
+@click.option('--p4', 'against_p4', type=bool, is_flag=True, help="Also check that the revisions the P4 client has match git, using the digests stored by the server")
+@click.option('--json', 'as_json', type=bool, is_flag=True, help="Print the results as JSON")
+@discover_option
+def verify(ctx: click.Context, configs: list[str], jobs: int, against_p4: bool, as_json: bool, discover: str):
+    """
+    Check that the files of submodules match the commits they are on.
+
+    Every file in the working tree is hashed as a git blob (LFS files against the sha256 in their pointer) and compared with the tree of the tracking branch.
+    Files with CRLF line endings that otherwise match are accepted, as P4 clients may write text files that way.
+    Nothing is fetched and no changes are made in git or P4.
+    """
+    p4 = _p4(ctx)
+
+    results: list[dict[str, Any]] = []
+    for module in (module for config in _discover_configs(configs, p4, discover) for module in config.submodules):
+        start = time.perf_counter()
+        try:
+            files, mismatches = module.verify(jobs, against_p4)
+        except Exception as e:
+            results.append({'name': module.name, 'path': str(module.local_path), 'error': str(e)})
+            if not as_json:
+                print(f"[{module.name}] Failed to verify: {e}")
+            continue
+
+        elapsed = time.perf_counter() - start
+        results.append({
+            'name': module.name,
+            'path': str(module.local_path),
+            'files': files,
+            'seconds': round(elapsed, 3),
+            'mismatches': [mismatch._asdict() for mismatch in mismatches],
+        })
+        if not as_json:
+            for mismatch in mismatches:
+                print(f"[{module.name}] {mismatch.problem}: {mismatch.path}")
+            print(f"[{module.name}] Verified {files} files in {elapsed:.2f}s ({files / max(elapsed, 1e-6):.0f} files/s), {len(mismatches)} mismatches")
+
+    if as_json:
+        print(json.dumps(results, indent=2))
+
+    if failed := sum(1 for result in results if result.get('error') or result.get('mismatches')):
+        raise click.ClickException(f"{failed} of {len(results)} submodules don't match")
+
+@main.command()
+@click.pass_context
+@click.argument('changelists', type=int, nargs=-1, required=True)
+@submit_options
+def submit(ctx: click.Context, changelists: list[int], submit_threads: int, submit_batch: Optional[int], submit_retries: int):
+    """
+    Submit changelists created by `create` or `update`, transferring their files over several threads.
+
+    Submits that lose their connection to the server are retried, after checking that the server didn't complete them anyway.
+    """
+    from .changelist import Changelist
+
+    p4 = _p4(ctx)
+
+    for number in changelists:
+        _submit(Changelist(p4, number), submit_threads, submit_batch, submit_retries)
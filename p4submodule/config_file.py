@@ -2,13 +2,19 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+from __future__ import annotations
+
+import threading
 import tomlkit.api
 from pathlib import Path
 from tomlkit.toml_document import TOMLDocument
 from tomlkit.toml_file import TOMLFile
 from typing import Optional
 
+from . import state
+from .changelist import Changelist
 from .p4_context import P4Path, P4Context
+from .state import ConfigState, Stamp
 from .submodule import Submodule
 
 class ConfigFile(TOMLFile):
@@ -23,10 +29,29 @@ class ConfigFile(TOMLFile):
 
     _p4: P4Context
 
-    _document: TOMLDocument
+    _document: Optional[TOMLDocument]
+    """The parsed file, only read when the cached state can't be used or the file is being modified (see document)"""
+
+    _state: Optional[ConfigState]
+    """The cached state of the file, if it's still valid"""
+
+    _stamp: Optional[Stamp]
+    """The contents of the file the submodules were read from (None until the file is written, for new files)"""
+
+    _depot_paths: dict[str, str]
+    """The depot path of the directory, keyed by server and client"""
 
     _is_new: bool
 
+    _submodules: Optional[list[Submodule]]
+    """The submodules in the file, built on first access"""
+
+    lock: threading.RLock
+    """Guards the document, which may be modified by submodules being updated on different threads"""
+
+    modified: bool
+    """Whether the document has changes that haven't been written yet"""
+
     def __init__(self, path: Path, p4: P4Context) -> None:
         if not isinstance(path, Path):
             path = Path(path)
@@ -40,18 +65,40 @@ class ConfigFile(TOMLFile):
         super().__init__(path)
 
         self._p4 = p4
+        self.lock = threading.RLock()
+        self.modified = False
+        self._submodules = None
 
-        if path.exists():
-            self._is_new = False
-            self._document = self.read()
-        else:
-            self._is_new = True
-            self._document = TOMLDocument()
+        self._document = None
+        self._is_new = not path.exists()
+        self._state = None if self._is_new else state.load(path)
+        self._stamp = Stamp(self._state.mtime_ns, self._state.size, self._state.digest) if self._state else None
+        self._depot_paths = dict(self._state.depot_paths) if self._state else {}
+
+    @property
+    def document(self) -> TOMLDocument:
+        """The parsed config file, read on first access"""
+        with self.lock:
+            if self._document is None:
+                if self._is_new:
+                    self._document = TOMLDocument()
+                else:
+                    # Submodules built from the cached state stay valid, as long as the file still matches it
+                    current = state.stamp(self._path)
+                    if self._stamp and current.digest != self._stamp.digest:
+                        raise Exception(f"{self._path} changed while it was being used")
+                    self._stamp = current
+                    self._document = self.read()
+            return self._document
 
     @property
     def p4(self) -> P4Context:
         return self._p4
 
+    @property
+    def path(self) -> Path:
+        return self._path
+
     @property
     def directory(self) -> Path:
         return self._path.parent
@@ -62,54 +109,121 @@ class ConfigFile(TOMLFile):
 
     @property
     def directory_depot(self) -> P4Path:
-        return P4Path(self._p4.run_where(self.directory)[0]['depotFile'])
+        if self._depot_key not in self._depot_paths:
+            ConfigFile.look_up_depot_paths([self])
+        return P4Path(self._depot_paths[self._depot_key])
+
+    @property
+    def _depot_key(self) -> str:
+        return f'{self._p4.port} {self._p4.client}'
+
+    @staticmethod
+    def look_up_depot_paths(configs: list[ConfigFile]) -> None:
+        """Look up the depot paths of the configs that don't have them cached, all in one `p4 where`"""
+        missing = [config for config in configs if config._depot_key not in config._depot_paths]
+        if missing:
+            for config, depot_path in zip(missing, missing[0]._p4.where(*[config.directory for config in missing])):
+                config._depot_paths[config._depot_key] = str(depot_path)
 
     @property
     def submodules(self) -> list[Submodule]:
         """Collect the list of submodules from the config file"""
+        if self._submodules is not None:
+            return self._submodules
+
         submodules: list[Submodule] = []
 
-        for name, child in self._document.get('submodule', dict()).items():
-            submodules.append(Submodule(name, self, child))
+        if self._state:
+            submodules = [Submodule.from_state(self, submodule_state) for submodule_state in self._state.submodules]
+
+        else:
+            document = self.document
+            for name, child in document.get('submodule', dict()).items():
+                submodules.append(Submodule(name, self, child, key=name))
 
-        # Create a submodule from root-level settings
-        if len(self._document) > 0:
-            name = self._document.get('name', self.directory.name)
-            submodules.insert(0, Submodule(name, self, self._document))
+            # Create a submodule from root-level settings
+            if len(document) > 0:
+                name = document.get('name', self.directory.name)
+                submodules.insert(0, Submodule(name, self, document))
 
+        self._submodules = submodules
         return submodules
 
+    def table(self, key: Optional[str]) -> tomlkit.api.Container:
+        """The table of the submodule under [submodule] with key, or the root-level table if key is None"""
+        document = self.document
+        return document['submodule'][key] if key else document
+
     def add_submodule(self, name: Optional[str], path: Optional[Path], is_root: bool = False) -> Submodule:
         """Create a new submodule and add it to the file"""
+        # Collect the existing submodules before the document is modified
+        submodules = self.submodules
+        self.modified = True
+
         if path:
             path = path.resolve()
             if path.is_absolute():
                 path = path.relative_to(self.directory)
 
         if is_root:
-            new_table = tomlkit.api.Table(self._document, tomlkit.api.Trivia(), False)
+            new_table = tomlkit.api.Table(self.document, tomlkit.api.Trivia(), False)
             if name:
                 new_table.add('name', name)
         else:
             if not name:
                 raise ValueError('If is_root is false, a name is required')
 
-            submodule_table = self._document.setdefault('submodule', tomlkit.api.table(True))
+            submodule_table = self.document.setdefault('submodule', tomlkit.api.table(True))
             new_table = tomlkit.api.table()
             submodule_table.add(name, new_table)
 
-        return Submodule(name, self, new_table.value, path=path)
-
-    def save(self, change_number: int) -> None:
-        """Save changes to the config file"""
+        new = Submodule(name, self, new_table.value, path=path, key=None if is_root else name)
+        if is_root:
+            submodules.insert(0, new)
+        else:
+            submodules.append(new)
 
-        file_path_ws = P4Path(f'//{self._p4.client}') / self._path.relative_to(self._p4.client_root)
-        p4_args = ['-c', str(change_number), file_path_ws]
+        return new
 
-        if not self._is_new:
-            self.p4.run_edit(*p4_args)
+    @property
+    def is_new(self) -> bool:
+        """Whether the config file hasn't been written yet"""
+        return self._is_new
 
-        self.write(self._document)
+    @property
+    def file_ws(self) -> P4Path:
+        return P4Path(f'//{self._p4.client}') / self._path.relative_to(self._p4.client_root)
+
+    def write_document(self) -> None:
+        """Write the config file to disk (it must already be opened in P4, see save)"""
+        with self.lock:
+            self.write(self.document)
+            self.modified = False
+            self._is_new = False
+            self._stamp = state.stamp(self._path)
+        self.save_state()
+
+    def save_state(self) -> None:
+        """Cache the submodules' settings (and what was learned about their remotes), so later runs needn't parse the file"""
+        with self.lock:
+            # Unsaved changes, or changes made by someone else, mustn't be cached
+            if not self._stamp or self.modified:
+                return
+            try:
+                stat = self._path.stat()
+            except OSError:
+                return
+            if (stat.st_mtime_ns, stat.st_size) != self._stamp[:2]:
+                return
+
+            state.save(self._path, ConfigState(
+                mtime_ns=self._stamp.mtime_ns,
+                size=self._stamp.size,
+                digest=self._stamp.digest,
+                submodules=[submodule.state() for submodule in self.submodules],
+                depot_paths=self._depot_paths,
+            ))
 
-        if self._is_new:
-            self.p4.run_add(*p4_args)
+    def save(self, change_number: int) -> None:
+        """Save changes to the config file"""
+        Changelist(self.p4, change_number).save_configs([self])
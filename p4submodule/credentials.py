@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import getpass
+import os
+import threading
+from os.path import expanduser
+from pathlib import Path
+from typing import Any, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from paramiko.config import SSHConfig
+
+DEFAULT_IDENTITIES = ('id_ed25519', 'id_ecdsa', 'id_rsa')
+"""The keys in ~/.ssh that are tried when the SSH config doesn't say which to use"""
+
+AGENT = 'ssh-agent'
+"""Stands for the keys held by the SSH agent in a list of credentials"""
+
+Credential = Path | str
+"""A private key file, or AGENT"""
+
+class CredentialResolver(object):
+    """
+    Works out which SSH keys to offer each host, shared by every remote operation in the process.
+
+    ~/.ssh/config is only parsed once, and the key a host last accepted is offered to it first, so later connections
+    authenticate on the first attempt.
+    """
+
+    _lock: threading.Lock
+
+    _config: Optional[SSHConfig] | bool
+    """The parsed SSH config (None if there isn't one), or False if it hasn't been read yet"""
+
+    _credentials: dict[str, list[Credential]]
+    """The credentials to offer each host, in the order to offer them"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._config = False
+        self._credentials = {}
+
+    def credentials(self, host: str) -> list[Credential]:
+        """The credentials to offer host, most likely to be accepted first"""
+        with self._lock:
+            if host not in self._credentials:
+                self._credentials[host] = self._find_credentials(host)
+            return list(self._credentials[host])
+
+    def offered(self, host: str, credential: Credential) -> None:
+        """
+        Record that credential was offered to host, so it's offered first from now on.
+
+        libgit2 asks for another credential when one is rejected, so the last one offered is the one that was accepted.
+        """
+        with self._lock:
+            credentials = self._credentials[host]
+            credentials.remove(credential)
+            credentials.insert(0, credential)
+
+    def username(self, host: str) -> str:
+        """The user to log in to host as when the remote URL doesn't name one"""
+        with self._lock:
+            return self._host_config(host).get('user') or getpass.getuser()
+
+    def _host_config(self, host: str) -> dict[str, Any]:
+        if self._config is False:
+            # paramiko is slow to import and only needed to read the SSH config
+            ssh_config_path = Path(expanduser('~/.ssh/config'))
+            if ssh_config_path.exists():
+                from paramiko.config import SSHConfig
+                self._config = SSHConfig.from_path(str(ssh_config_path))
+            else:
+                self._config = None
+
+        return self._config.lookup(host) if self._config else {}
+
+    def _find_credentials(self, host: str) -> list[Credential]:
+        host_config = self._host_config(host)
+
+        # Keys configured for the host are the most specific, so they go first
+        identities = [Path(expanduser(path)) for path in host_config.get('identityfile', [])]
+        credentials: list[Credential] = [path for path in identities if path.exists()]
+
+        # Like ssh, IdentitiesOnly keeps other keys (from the agent or ~/.ssh) from being offered
+        if credentials and host_config.get('identitiesonly', 'no').lower() == 'yes':
+            return credentials
+
+        # libssh2 reaches the agent through SSH_AUTH_SOCK, or Pageant on Windows
+        if os.environ.get('SSH_AUTH_SOCK') or os.name == 'nt':
+            credentials.append(AGENT)
+
+        for name in DEFAULT_IDENTITIES:
+            path = Path(expanduser(f'~/.ssh/{name}'))
+            if path.exists() and path not in credentials:
+                credentials.append(path)
+
+        return credentials
+
+resolver = CredentialResolver()
+"""The resolver shared by every remote operation"""
@@ -0,0 +1,200 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import glob
+import json
+import os
+import re
+from pathlib import Path
+from typing import Optional, TYPE_CHECKING
+
+from .cache import cache_dir
+
+if TYPE_CHECKING:
+    from .p4_context import P4Context
+
+CONFIG_FILE = "submodule.toml"
+
+SOURCES = ('glob', 'p4', 'index')
+"""The ways config files can be discovered"""
+
+def _config_pattern(config_entry: str) -> str:
+    if not config_entry.endswith(CONFIG_FILE):
+        config_entry = config_entry + "/" + CONFIG_FILE
+    return config_entry
+
+def _glob_regex(pattern: str) -> re.Pattern:
+    """Convert a recursive glob pattern into a regex matching the same absolute paths"""
+    regex = ''
+    for part in re.split(r'(\*\*/|\*\*|\*|\?)', Path(os.path.abspath(pattern)).as_posix()):
+        if part == '**/':
+            regex += '(?:.*/)?'
+        elif part == '**':
+            regex += '.*'
+        elif part == '*':
+            regex += '[^/]*'
+        elif part == '?':
+            regex += '[^/]'
+        else:
+            regex += re.escape(part)
+    return re.compile(regex + r'\Z', re.IGNORECASE if os.name == 'nt' else 0)
+
+def _static_root(pattern: str) -> Path:
+    """The deepest directory of pattern that doesn't contain any wildcards"""
+    root = Path(os.path.abspath(pattern))
+    while glob.has_magic(str(root)) or root.name == CONFIG_FILE:
+        root = root.parent
+    return root
+
+def _max_depth(pattern: str, root: Path) -> Optional[int]:
+    """How many directories below root pattern's config files can be, or None if ** lets them be anywhere"""
+    relative = Path(os.path.abspath(pattern)).relative_to(root)
+    if any('**' in part for part in relative.parts):
+        return None
+    return len(relative.parts) - 1
+
+def discover_configs(configs: list[str], p4: P4Context, source: str = 'glob') -> list[Path]:
+    """
+    Expand the config arguments of a command into the config files they match.
+
+    glob walks the filesystem, p4 asks the server for the config files mapped in the client, and index reads
+    a persistent index of the filesystem that only rescans directories that have changed since the last run.
+    """
+    patterns = [_config_pattern(config_entry) for config_entry in configs]
+
+    if source == 'p4':
+        return _discover_p4(patterns, p4)
+
+    elif source == 'index':
+        index = ConfigIndex(cache_dir() / 'config-index.json')
+        try:
+            return [path for pattern in patterns for path in index.find(pattern)]
+        finally:
+            index.save()
+
+    return [Path(config_file) for pattern in patterns for config_file in glob.iglob(pattern, recursive=True)]
+
+def _discover_p4(patterns: list[str], p4: P4Context) -> list[Path]:
+    # P4's ... wildcard already matches any number of directories
+    p4_patterns = [pattern.replace('**', '...') for pattern in patterns]
+
+    # A pattern that matches nothing is a warning, not an error
+    with p4.at_exception_level(p4.RAISE_ERROR):
+        files = p4.run_fstat('-T', 'clientFile,headAction', *p4_patterns)
+
+    paths: dict[Path, None] = {}
+    for file in files:
+        if file.get('headAction') in ('delete', 'move/delete') or 'clientFile' not in file:
+            continue
+        path = Path(file['clientFile'])
+        # Only configs that are actually on disk can be worked with
+        if path.name == CONFIG_FILE and path.is_file():
+            paths[path] = None
+
+    return list(paths)
+
+class ConfigIndex(object):
+    """
+    A persistent index of the directories in a tree and which of them contain config files.
+
+    Directories are revalidated by their mtime, which changes whenever an entry is added or removed, so only
+    directories that have changed since the last run are read again. A directory's mtime doesn't change with its
+    subdirectories though, so every directory a pattern can reach is still stat'ed; patterns without ** only reach
+    as deep as their last wildcard.
+    """
+
+    path: Path
+    """The file the index is stored in"""
+
+    _roots: dict[str, dict[str, list]]
+    """
+    Maps a root directory (and how deep it was walked, see _root_key) to its directories (relative to the root) and
+    their [mtime, subdirectories, has config]
+    """
+
+    _dirty: bool
+
+    VERSION = 2
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._roots = {}
+        self._dirty = False
+
+        try:
+            data = json.loads(path.read_text())
+            if data.get('version') == ConfigIndex.VERSION:
+                self._roots = data['roots']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def find(self, pattern: str) -> list[Path]:
+        """Find the config files matching a recursive glob pattern"""
+        root = _static_root(pattern)
+        regex = _glob_regex(pattern)
+
+        directories = self._refresh(root, _max_depth(pattern, root))
+
+        configs = [
+            root / directory / CONFIG_FILE if directory != '.' else root / CONFIG_FILE
+            for directory, (_, _, has_config) in directories.items()
+            if has_config
+        ]
+        return [config for config in configs if regex.match(config.as_posix())]
+
+    def save(self) -> None:
+        """Write the index if it changed, replacing the previous one atomically so an interrupted run can't corrupt it"""
+        if self._dirty:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+            temp.write_text(json.dumps({'version': ConfigIndex.VERSION, 'roots': self._roots}))
+            os.replace(temp, self.path)
+
+    @staticmethod
+    def _root_key(root: Path, max_depth: Optional[int]) -> str:
+        # Walks limited to different depths hold different directories, so they're kept apart
+        return str(root) if max_depth is None else f'{root}?depth={max_depth}'
+
+    def _refresh(self, root: Path, max_depth: Optional[int] = None) -> dict[str, list]:
+        key = ConfigIndex._root_key(root, max_depth)
+        previous = self._roots.get(key, {})
+        current: dict[str, list] = {}
+
+        pending = [('.', 0)]
+        while pending:
+            directory, depth = pending.pop()
+            try:
+                mtime = os.stat(root / directory).st_mtime_ns
+            except OSError:
+                continue
+
+            entry = previous.get(directory)
+            if not entry or entry[0] != mtime:
+                entry = [mtime, *self._scan(root / directory)]
+                self._dirty = True
+
+            current[directory] = entry
+            if max_depth is None or depth < max_depth:
+                pending.extend((f'{directory}/{child}' if directory != '.' else child, depth + 1) for child in entry[1])
+
+        if len(current) != len(previous):
+            self._dirty = True
+
+        self._roots[key] = current
+        return current
+
+    @staticmethod
+    def _scan(directory: Path) -> tuple[list[str], bool]:
+        children: list[str] = []
+        has_config = False
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != '.git':
+                        children.append(entry.name)
+                elif entry.name == CONFIG_FILE:
+                    has_config = True
+        return children, has_config
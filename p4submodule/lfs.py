@@ -0,0 +1,422 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import base64
+import configparser
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+import urllib.error
+import urllib.request
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse, urlunparse
+
+import pygit2
+from pygit2.enums import AttrCheck, FilterMode
+
+from .cache import cache_dir
+from .mirror import normalize_remote_url
+
+SPEC = 'https://git-lfs.github.com/spec/v1'
+
+MAX_POINTER_SIZE = 1024
+"""Pointer files are never larger than this"""
+
+MEDIA_TYPE = 'application/vnd.git-lfs+json'
+
+CHUNK_SIZE = 1024 * 1024
+
+COMMAND_TIMEOUT = 30
+"""Seconds to wait for ssh or git credential helpers"""
+
+class LfsAuthenticationError(Exception):
+    """The LFS server refused the credentials (or the lack of them) that were available"""
+
+class LfsPointer(object):
+    """
+    The contents git stores in place of a file tracked by LFS
+    """
+
+    oid: str
+    """The sha256 of the file's contents"""
+
+    size: int
+
+    POINTER_REGEX = re.compile(rb'version (\S+)\n(?:.*\n)*?oid sha256:([0-9a-f]{64})\n(?:.*\n)*?size (\d+)\n', re.MULTILINE)
+
+    def __init__(self, oid: str, size: int) -> None:
+        self.oid = oid
+        self.size = size
+
+    def __repr__(self) -> str:
+        return f'LfsPointer(oid="{self.oid}" size={self.size})'
+
+    @staticmethod
+    def parse(data: bytes) -> Optional[LfsPointer]:
+        if len(data) > MAX_POINTER_SIZE or not data.startswith(b'version '):
+            return None
+        match = LfsPointer.POINTER_REGEX.match(data)
+        if not match or match.group(1).decode() != SPEC:
+            return None
+        return LfsPointer(match.group(2).decode(), int(match.group(3)))
+
+    def encode(self) -> bytes:
+        return f'version {SPEC}\noid sha256:{self.oid}\nsize {self.size}\n'.encode()
+
+def shared_objects() -> Path:
+    """The LFS objects shared by every repository on this machine"""
+    return cache_dir() / 'lfs' / 'objects'
+
+def object_path(root: Path, oid: str) -> Path:
+    """Where an object lives in an LFS object directory (the same layout git-lfs uses)"""
+    return root / oid[0:2] / oid[2:4] / oid
+
+def find_object(git_dir: Path, oid: str) -> Optional[Path]:
+    """Find the contents of an LFS object in a repository's own store or the shared one"""
+    for root in (git_dir / 'lfs' / 'objects', shared_objects()):
+        path = object_path(root, oid)
+        if path.is_file():
+            return path
+    return None
+
+def find_pointers(repo: pygit2.Repository, commit: pygit2.Oid, paths: Optional[Iterable[str]] = None) -> dict[str, LfsPointer]:
+    """
+    Find the LFS pointers in commit (limited to paths, if given), which are files with the lfs filter attribute holding a pointer.
+    """
+    tree = repo[commit].peel(pygit2.Tree)
+
+    # Entries aren't looked at unless some .gitattributes file in the tree mentions LFS
+    index = pygit2.Index()
+    index.read_tree(tree)
+    if not any(entry.path.endswith('.gitattributes') and b'filter=lfs' in repo[entry.id].data for entry in index):
+        return {}
+
+    flags = AttrCheck.INCLUDE_COMMIT | AttrCheck.INDEX_ONLY | AttrCheck.NO_SYSTEM
+    entries = [entry for entry in index] if paths is None else [index[path] for path in paths if path in index]
+
+    pointers: dict[str, LfsPointer] = {}
+    for entry in entries:
+        if repo.get_attr(entry.path, 'filter', flags, commit=commit) != 'lfs':
+            continue
+        if pointer := LfsPointer.parse(repo[entry.id].data):
+            pointers[entry.path] = pointer
+    return pointers
+
+def configured_endpoint(repo: pygit2.Repository, commit: pygit2.Oid) -> Optional[str]:
+    """The LFS server set by lfs.url in the git config, or else in .lfsconfig in commit"""
+    if 'lfs.url' in repo.config:
+        return repo.config['lfs.url']
+
+    tree = repo[commit].peel(pygit2.Tree)
+    if '.lfsconfig' in tree:
+        parser = configparser.ConfigParser(strict=False)
+        try:
+            parser.read_string(tree['.lfsconfig'].data.decode())
+            if url := parser.get('lfs', 'url', fallback=None):
+                return url
+        except configparser.Error:
+            pass
+
+    return None
+
+def endpoint(repo: pygit2.Repository, commit: pygit2.Oid, remote_url: str) -> str:
+    """
+    The LFS server to use for a remote, following git-lfs: lfs.url from the git config, then from .lfsconfig in commit,
+    and otherwise <remote>.git/info/lfs over https.
+    """
+    if url := configured_endpoint(repo, commit):
+        return url
+
+    remote = urlparse(normalize_remote_url(remote_url))
+    path = remote.path.rstrip('/')
+    if not path.endswith('.git'):
+        path += '.git'
+
+    # Remotes accessed over ssh are assumed to serve LFS over https from the same host
+    scheme = remote.scheme if remote.scheme in ('http', 'https') else 'https'
+    netloc = remote.netloc if remote.scheme in ('http', 'https') else (remote.hostname or '')
+    return urlunparse((scheme, netloc, f'{path}/info/lfs', '', '', ''))
+
+def ssh_authenticate(remote_url: str) -> Optional[tuple[str, dict[str, str]]]:
+    """
+    Ask an ssh remote for the LFS server to download from and the headers to authenticate to it with, like git-lfs does
+    (through `git-lfs-authenticate`). Returns None if the remote isn't an ssh one, or can't answer.
+    """
+    remote = urlparse(normalize_remote_url(remote_url))
+    if remote.scheme not in ('ssh', 'git+ssh', 'ssh+git') or not remote.hostname:
+        return None
+
+    command = ['ssh', '-o', 'BatchMode=yes']
+    if remote.port:
+        command += ['-p', str(remote.port)]
+    command += [f'{remote.username}@{remote.hostname}' if remote.username else remote.hostname, 'git-lfs-authenticate', remote.path.lstrip('/'), 'download']
+
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=COMMAND_TIMEOUT, stdin=subprocess.DEVNULL)
+        if result.returncode != 0:
+            return None
+        response = json.loads(result.stdout)
+    except (OSError, subprocess.TimeoutExpired, json.JSONDecodeError):
+        return None
+
+    if not isinstance(response, dict) or 'href' not in response:
+        return None
+    return response['href'], dict(response.get('header', {}))
+
+def git_credential(action: str, url: str, credential: Optional[dict[str, str]] = None) -> Optional[dict[str, str]]:
+    """
+    Run `git credential <action>` (fill, approve or reject) for url, without ever prompting.
+
+    Returns the helper's answer for fill (None if git or a credential isn't available).
+    """
+    parsed = urlparse(url)
+    fields = {'protocol': parsed.scheme, 'host': parsed.netloc, 'path': parsed.path.lstrip('/'), **(credential or {})}
+    try:
+        result = subprocess.run(
+            ['git', 'credential', action],
+            input=''.join(f'{key}={value}\n' for key, value in fields.items()) + '\n',
+            capture_output=True, text=True, timeout=COMMAND_TIMEOUT,
+            env={**os.environ, 'GIT_TERMINAL_PROMPT': '0', 'GCM_INTERACTIVE': 'never'},
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+    if result.returncode != 0:
+        return None
+    answer = dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
+    return answer if 'password' in answer else None
+
+class LfsClient(object):
+    """
+    Downloads LFS objects through the batch API, transferring several objects at once
+    """
+
+    endpoint: str
+
+    jobs: int
+    """The number of objects to transfer at once"""
+
+    _headers: dict[str, str]
+
+    BATCH_SIZE = 100
+    """The number of objects to ask the server about in each batch request"""
+
+    TIMEOUT = 60
+
+    def __init__(self, endpoint: str, jobs: int = 8, headers: Optional[dict[str, str]] = None) -> None:
+        url = urlparse(endpoint)
+        self._headers = {'Accept': MEDIA_TYPE, 'Content-Type': MEDIA_TYPE, **(headers or {})}
+
+        # Credentials in the URL are sent as basic auth, urllib doesn't do this by itself
+        if url.username:
+            credentials = f'{url.username}:{url.password or ""}'.encode()
+            self._headers['Authorization'] = f'Basic {base64.b64encode(credentials).decode()}'
+            url = url._replace(netloc=url.hostname + (f':{url.port}' if url.port else ''))
+
+        self.endpoint = urlunparse(url).rstrip('/')
+        self.jobs = jobs
+
+    def download(self, pointers: Iterable[LfsPointer], destination: Path, on_object: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Download objects into the destination object directory, skipping ones that are already there.
+
+        on_object is called with the size of each object as it completes. Returns the number of bytes downloaded.
+        """
+        missing = {pointer.oid: pointer for pointer in pointers if not object_path(destination, pointer.oid).is_file()}
+        if not missing:
+            return 0
+
+        missing_list = list(missing.values())
+        total = 0
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = []
+            for start in range(0, len(missing_list), LfsClient.BATCH_SIZE):
+                batch = missing_list[start:start + LfsClient.BATCH_SIZE]
+                for response in self._batch(batch):
+                    if 'error' in response:
+                        raise Exception(f"LFS object {response['oid']} could not be downloaded: {response['error'].get('message')}")
+                    action = response.get('actions', {}).get('download')
+                    if not action:
+                        # The server doesn't return actions for objects the client already has
+                        continue
+                    futures.append(executor.submit(self._download, missing[response['oid']], action, destination, on_object))
+
+            for future in futures:
+                total += future.result()
+
+        return total
+
+    def _batch(self, pointers: list[LfsPointer]) -> list[dict]:
+        body = json.dumps({
+            'operation': 'download',
+            'transfers': ['basic'],
+            'objects': [{'oid': pointer.oid, 'size': pointer.size} for pointer in pointers],
+        }).encode()
+        credential: Optional[dict[str, str]] = None
+        while True:
+            request = urllib.request.Request(f'{self.endpoint}/objects/batch', data=body, headers=self._headers, method='POST')
+            try:
+                with urllib.request.urlopen(request, timeout=LfsClient.TIMEOUT) as response:
+                    objects = json.load(response).get('objects', [])
+                if credential:
+                    git_credential('approve', self.endpoint, credential)
+                return objects
+
+            except urllib.error.HTTPError as e:
+                if e.code not in (401, 403):
+                    raise Exception(f"LFS batch request to {self.endpoint} failed: {e.code} {e.reason}") from None
+
+                if credential:
+                    git_credential('reject', self.endpoint, credential)
+                # Like git-lfs, credentials are only looked up once the server asks for them
+                elif 'Authorization' not in self._headers and (credential := git_credential('fill', self.endpoint)):
+                    basic = f"{credential.get('username', '')}:{credential['password']}".encode()
+                    self._headers['Authorization'] = f'Basic {base64.b64encode(basic).decode()}'
+                    continue
+
+                raise LfsAuthenticationError(f"{self.endpoint} refused the LFS batch request: {e.code} {e.reason}") from None
+
+    def _download(self, pointer: LfsPointer, action: dict, destination: Path, on_object: Optional[Callable[[int], None]]) -> int:
+        target = object_path(destination, pointer.oid)
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        request = urllib.request.Request(action['href'], headers=action.get('header', {}))
+        digest = hashlib.sha256()
+        size = 0
+        with urllib.request.urlopen(request, timeout=LfsClient.TIMEOUT) as response, \
+                tempfile.NamedTemporaryFile(dir=target.parent, delete=False) as temp:
+            while chunk := response.read(CHUNK_SIZE):
+                digest.update(chunk)
+                temp.write(chunk)
+                size += len(chunk)
+
+        if digest.hexdigest() != pointer.oid or size != pointer.size:
+            os.unlink(temp.name)
+            raise Exception(f"LFS object {pointer.oid} was corrupted during download")
+
+        # Another process may have finished the same object first, either copy is fine
+        os.replace(temp.name, target)
+        if on_object:
+            on_object(size)
+        return size
+
+def missing(repo: pygit2.Repository, commit: pygit2.Oid, paths: Optional[Iterable[str]] = None) -> dict[str, LfsPointer]:
+    """The pointers in commit (limited to paths) whose contents aren't available locally, by oid"""
+    pointers = find_pointers(repo, commit, paths)
+    return {pointer.oid: pointer for pointer in pointers.values() if not find_object(Path(repo.path), pointer.oid)}
+
+def fetch(repo: pygit2.Repository, commit: pygit2.Oid, remote_url: str, paths: Optional[Iterable[str]] = None, jobs: int = 8) -> tuple[int, int]:
+    """
+    Make sure the contents of every LFS pointer in commit (limited to paths) are available locally, so checking it out smudges them.
+
+    Returns the number of objects and bytes downloaded.
+    """
+    needed = missing(repo, commit, paths)
+    if not needed:
+        return 0, 0
+
+    # ssh remotes hand out the server and credentials to use, unless the server is configured
+    url = configured_endpoint(repo, commit)
+    headers: dict[str, str] = {}
+    if not url and (authenticated := ssh_authenticate(remote_url)):
+        url, headers = authenticated
+
+    client = LfsClient(url or endpoint(repo, commit, remote_url), jobs, headers)
+    return len(needed), client.download(needed.values(), shared_objects())
+
+class LfsFilter(pygit2.Filter):
+    """
+    Replaces LFS pointers with their contents on checkout, and file contents with pointers when they are hashed or staged
+    """
+
+    # Only files with filter=lfs reach the filter at all. Passing other files through from check() instead
+    # corrupts the refcount of None in pygit2, crashing on checkouts of many files.
+    attributes = 'filter=lfs'
+
+    _smudge: bool
+    """Whether the data is being checked out, rather than hashed or staged"""
+
+    _git_dir: Path
+
+    _buffer: list[bytes]
+    """The data written so far (until it's too large to be a pointer, when cleaning)"""
+
+    _digest: hashlib._Hash
+
+    _size: int
+
+    _temp: Optional[tempfile._TemporaryFileWrapper]
+    """Where large files being cleaned are streamed to, rather than being held in memory"""
+
+    def check(self, src: pygit2.FilterSource, attr_values: list[Optional[str]]) -> None:
+        # The source is only valid during each call, so keep what's needed from it
+        self._smudge = src.mode == FilterMode.SMUDGE
+        self._git_dir = Path(src.repo.path)
+        self._buffer = []
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._temp = None
+
+    def write(self, data: bytes, src: pygit2.FilterSource, write_next: Callable[[bytes], None]) -> None:
+        self._size += len(data)
+
+        if self._smudge:
+            self._buffer.append(data)
+            return
+
+        self._digest.update(data)
+        if self._temp:
+            self._temp.write(data)
+        elif self._size > MAX_POINTER_SIZE:
+            objects = self._git_dir / 'lfs' / 'objects'
+            objects.mkdir(parents=True, exist_ok=True)
+            self._temp = tempfile.NamedTemporaryFile(dir=objects, delete=False)
+            self._temp.write(b''.join(self._buffer) + data)
+            self._buffer = []
+        else:
+            self._buffer.append(data)
+
+    def close(self, write_next: Callable[[bytes], None]) -> None:
+        data = b''.join(self._buffer)
+        pointer = LfsPointer.parse(data)
+
+        if self._smudge:
+            path = find_object(self._git_dir, pointer.oid) if pointer else None
+            if not path:
+                # Like GIT_LFS_SKIP_SMUDGE, objects that aren't available are left as pointers
+                write_next(data)
+                return
+            with open(path, 'rb') as file:
+                while chunk := file.read(CHUNK_SIZE):
+                    write_next(chunk)
+            return
+
+        if pointer and not self._temp:
+            # Files that were never smudged are already pointers
+            write_next(data)
+            return
+
+        # Keep the contents of the cleaned file, so the pointer can be smudged again later (like git-lfs does)
+        pointer = LfsPointer(self._digest.hexdigest(), self._size)
+        target = object_path(self._git_dir / 'lfs' / 'objects', pointer.oid)
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        if not self._temp:
+            self._temp = tempfile.NamedTemporaryFile(dir=target.parent, delete=False)
+            self._temp.write(data)
+        self._temp.close()
+        os.replace(self._temp.name, target)
+
+        write_next(pointer.encode())
+
+# The registry isn't thread safe, so the filter is registered once when the module is first imported
+pygit2.filter_register('lfs', LfsFilter)
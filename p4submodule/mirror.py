@@ -0,0 +1,160 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import re
+import sys
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+import pygit2
+
+from .profiling import profiler
+
+# Replace git@github.com:org/repo.git with ssh://git@github.com/org/repo.git
+GIT_SSH_REGEX = re.compile(R"([\w\.]+)@([\w\.]+):([\w\.@\:/\-~]+)")
+
+def normalize_remote_url(remote: str) -> str:
+    """Convert scp-style ssh remotes to URLs"""
+    if match := GIT_SSH_REGEX.match(remote):
+        return "ssh://{}@{}/{}".format(*match.groups())
+    return remote
+
+def set_tag_option(repo: pygit2.Repository, remote_name: str, tags: bool) -> None:
+    """Make fetches from a remote follow the tags pointing into the fetched history, or skip tags entirely"""
+    key = f'remote.{remote_name}.tagOpt'
+    if tags:
+        if key in repo.config:
+            del repo.config[key]
+    elif key not in repo.config or repo.config[key] != '--no-tags':
+        repo.config[key] = '--no-tags'
+
+@contextmanager
+def _process_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on path (creating it if needed), which other processes wait for"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a+b') as file:
+        # Unlike os.name, sys.platform lets pytype skip the branch for the other platform
+        if sys.platform == 'win32':
+            import msvcrt
+            file.seek(0)
+            # LK_LOCK gives up after 10 attempts a second apart, so keep trying
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+class MirrorCache(object):
+    """
+    A directory of bare repositories shared by every submodule (and workspace) tracking the same remote.
+
+    Each remote is fetched into its mirror at most once per run, and submodule repositories borrow the
+    mirror's objects through git alternates instead of downloading and storing their own copies.
+    Mirrors always hold the full history of the branches fetched into them, whatever the submodules' depth.
+    """
+
+    root: Path
+    """The directory containing the mirrors"""
+
+    _fetched: set[tuple[str, str, bool]]
+    """The mirror branches (and whether their tags were included) that have already been fetched during this run"""
+
+    _locks: dict[str, threading.Lock]
+
+    _lock: threading.Lock
+
+    def __init__(self, root: Path) -> None:
+        self.root = root.expanduser().absolute()
+        self._fetched = set()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str) -> str:
+        """Identify a remote independently of the protocol and user used to access it"""
+        parsed = urlparse(normalize_remote_url(url))
+        path = parsed.path.strip('/').removesuffix('.git')
+        if parsed.hostname:
+            path = f'{parsed.hostname.lower()}/{path}'
+        return re.sub(r'[^\w\.\-/]', '_', path)
+
+    def path(self, url: str) -> Path:
+        """The location of the mirror of url"""
+        return self.root / f'{MirrorCache.key(url)}.git'
+
+    def fetch(self, url: str, callbacks: pygit2.RemoteCallbacks, branch: str, tags: bool = False) -> Path:
+        """
+        Fetch branch of url into its mirror, unless that has already happened during this run, and return the mirror's path.
+
+        Tags are only fetched if tags is set, and then only the ones pointing into the fetched history.
+        """
+        key = MirrorCache.key(url)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        path = self.path(url)
+        # Other processes (updating other workspaces) may be fetching into the same mirror
+        with lock, _process_lock(self.root / f'{key}.lock'):
+            if (key, branch, tags) in self._fetched or (key, branch, True) in self._fetched:
+                return path
+
+            if (path / 'HEAD').exists():
+                mirror = pygit2.Repository(str(path))
+                mirror.remotes.set_url('origin', url)
+            else:
+                mirror = pygit2.init_repository(str(path), bare=True)
+                mirror.remotes.create('origin', url, '+refs/heads/*:refs/heads/*')
+
+            set_tag_option(mirror, 'origin', tags)
+            stats = mirror.remotes['origin'].fetch([f'+refs/heads/{branch}:refs/heads/{branch}'], callbacks=callbacks)
+            profiler.count('bytes fetched', stats.received_bytes)
+            profiler.count('objects fetched', stats.received_objects)
+            self._fetched.add((key, branch, tags))
+
+        return path
+
+    def attach(self, repo: pygit2.Repository, url: str) -> None:
+        """Let repo use the objects stored in the mirror of url"""
+        mirror_objects = str(self.path(url) / 'objects')
+        alternates = Path(repo.path) / 'objects' / 'info' / 'alternates'
+
+        existing = alternates.read_text().splitlines() if alternates.exists() else []
+        if mirror_objects not in existing:
+            alternates.parent.mkdir(parents=True, exist_ok=True)
+            alternates.write_text('\n'.join([*existing, mirror_objects]) + '\n')
+            # Alternates are only read when the repository is opened
+            repo.odb.add_disk_alternate(mirror_objects)
+
+        # A shallow repository no longer needs its grafts once the mirror has the history behind every one of them.
+        # Otherwise (an old current_ref after a force-push, say) it stays shallow, and is deepened from the remote.
+        shallow = Path(repo.path) / 'shallow'
+        if shallow.exists():
+            mirror = pygit2.Repository(str(self.path(url)))
+            boundaries = [pygit2.Oid(hex=line) for line in shallow.read_text().split()]
+            if all(parent in mirror.odb for boundary in boundaries for parent in _parents(repo, boundary)):
+                shallow.unlink()
+
+def _parents(repo: pygit2.Repository, commit: pygit2.Oid) -> list[pygit2.Oid]:
+    """The parents recorded in a commit, which libgit2 hides for the boundary commits of a shallow repository"""
+    _, data = repo.odb.read(commit)
+    headers = data.split(b'\n\n', 1)[0].split(b'\n')
+    return [pygit2.Oid(hex=line[len(b'parent '):].decode()) for line in headers if line.startswith(b'parent ')]
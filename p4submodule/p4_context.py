@@ -4,35 +4,180 @@
 
 from __future__ import annotations
 
+import hashlib
+import itertools
 import os
 import socket
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path, PurePosixPath
+from typing import Optional
 
 import P4 # type: ignore
 
+from .profiling import profiler
+
 P4Path = PurePosixPath
 
+def p4_escape(path: P4Path | str) -> str:
+    """Escape the characters P4 treats as wildcards or revision specifiers in a file name"""
+    path = str(path)
+    for char, escaped in (('%', '%25'), ('@', '%40'), ('#', '%23'), ('*', '%2A')):
+        path = path.replace(char, escaped)
+    return path
+
+def p4_unescape(path: str) -> str:
+    """Undo p4_escape, turning a path reported by P4 back into a file name"""
+    for char, escaped in (('@', '%40'), ('#', '%23'), ('*', '%2A'), ('%', '%25')):
+        path = path.replace(escaped, char)
+    return path
+
 class P4Context(P4.P4):
     """
     Wrapper for P4.P4 that gives it some extra functionality that we want
     """
 
+    BATCH_SIZE = 2000
+    """The number of file arguments to send in a single command by run_batched"""
+
     def __init__(self) -> None:
         # P4Python on Linux doesn't set cwd correctly by default, so we override it
         super().__init__(cwd=os.getcwd())
 
-    def __enter__(self) -> P4Context:
-        # We want with statements to connect to the p4 server
-        return super().__enter__().connect()
+        # P4Adapter rejects unknown attributes, so extra state has to go straight into __dict__
+        # The lock serializes access to the connection, hold it to make several commands atomic
+        self.__dict__['lock'] = threading.RLock()
+        # Server metadata that doesn't change during a run, keyed by the connection it came from
+        self.__dict__['_metadata'] = {}
+        # Depot paths of local paths (normcased), kept apart from _metadata so they can be typed
+        self.__dict__['_where'] = {}
+        self.__dict__['round_trips_saved'] = 0
+        # The number of connections run_batched may spread work over
+        self.__dict__['connections'] = 1
+
+    def __setattr__(self, name: str, value) -> None:
+        # Attributes added by __init__ live in __dict__, everything else belongs to P4Adapter
+        if name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            super().__setattr__(name, value)
+
+    def run(self, *args, **kargs):
+        """Wrapper around super().run that allows the connection to be shared between threads"""
+        with self.lock:
+            # Connecting is left to the first command, so commands that never talk to the server don't wait on it
+            if not self.connected():
+                with profiler.phase('p4 connect'):
+                    self.connect()
+
+            with profiler.phase(f'p4 {args[0]}'):
+                profiler.count('p4 commands', 1)
+                return super().run(*args, **kargs)
 
     def save_change(self, change) -> int:
         """Wrapper around super().save_change that returns the CL number"""
-        return int(super().__getattr__('save_change')(change)[0].split()[1])
+        # save_change sets self.input before running, so the pair needs to hold the lock
+        with self.lock:
+            return int(super().__getattr__('save_change')(change)[0].split()[1])
+
+    def new_connection(self) -> P4Context:
+        """Open an additional connection to the server with the same settings as this one"""
+        other = P4Context()
+        # p4config_file can't be set, but it follows from cwd (and P4CONFIG) just like ours did
+        other.cwd = self.cwd
+        for setting in ('port', 'user', 'client', 'host', 'password', 'ticket_file', 'charset', 'prog', 'version', 'api_level', 'exception_level'):
+            setattr(other, setting, getattr(self, setting))
+        return other.connect()
+
+    def run_batched(self, command: str, args: Iterable[str], files: Iterable[str], on_batch: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Run command over files, BATCH_SIZE files at a time, spreading the batches over self.connections connections.
+
+        files is consumed lazily, so very large file lists never have to be built in memory.
+        on_batch is called with the number of files in each batch as it completes. Returns the number of files processed.
+        """
+        args = list(args)
+        files = iter(files)
+        batches = iter(lambda: list(itertools.islice(files, self.BATCH_SIZE)), [])
+
+        # Other connections are only worth opening once there is a second batch to send
+        first = next(batches, [])
+        second = next(batches, []) if self.connections > 1 else []
+        if not second:
+            total = 0
+            for batch in itertools.chain([first] if first else [], batches):
+                with profiler.phase(f'{command} batch', files=len(batch)):
+                    self.run(command, *args, *batch)
+                total += len(batch)
+                if on_batch:
+                    on_batch(len(batch))
+            profiler.count(f'{command} files', total)
+            return total
+
+        local = threading.local()
+        opened: list[P4Context] = []
+
+        submodule = profiler.submodule
+
+        def _run(batch: list[str]) -> int:
+            if not hasattr(local, 'p4'):
+                local.p4 = self.new_connection()
+                opened.append(local.p4)
+            # Attribute the batches to the submodule that started them
+            with profiler.phase(f'{command} batch', submodule=submodule, files=len(batch)):
+                local.p4.run(command, *args, *batch)
+            return len(batch)
+
+        total = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                in_flight: set[Future[int]] = set()
+                for batch in itertools.chain([first, second], batches):
+                    # Bound the number of batches held in memory at once
+                    if len(in_flight) >= self.connections * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            total += future.result()
+                            if on_batch:
+                                on_batch(future.result())
+
+                    in_flight.add(executor.submit(_run, batch))
+
+                for future in in_flight:
+                    total += future.result()
+                    if on_batch:
+                        on_batch(future.result())
+        finally:
+            for p4 in opened:
+                p4.disconnect()
+
+        profiler.count(f'{command} files', total)
+        return total
+
+    @property
+    def _metadata_cache(self) -> dict:
+        """The metadata cache for the current port & client, changing either starts a fresh cache"""
+        return self._metadata.setdefault((self.port, self.client), {})
+
+    @property
+    def _where_cache(self) -> dict[str, P4Path]:
+        """The depot paths looked up by where() for the current port & client"""
+        return self._where.setdefault((self.port, self.client), {})
 
     @property
     def client_root(self) -> Path:
         """The working directory of the currently set client"""
+        with self.lock:
+            cache = self._metadata_cache
+            if 'client_root' in cache:
+                self.__dict__['round_trips_saved'] += 2
+                return cache['client_root']
 
+            cache['client_root'] = self._fetch_client_root()
+            return cache['client_root']
+
+    def _fetch_client_root(self) -> Path:
         # This is required because if you run 'p4 clients -o <whatever>' and <whatever> is a client that doesn't exist,
         # it will return you the template for a new client instead of erroring.
         existing_clients = [client['client'] for client in self.run_clients('--me')]
@@ -45,3 +190,67 @@ class P4Context(P4.P4):
             raise Exception(f"Client {self.client} has a Host of {client['Host']}, but curret hostname is {socket.gethostname()}")
 
         return Path(client['Root'])
+
+    def opened(self, directory: P4Path) -> list[P4Path]:
+        """The workspace paths of the files opened (in any changelist) under directory"""
+        with self.lock, self.at_exception_level(P4.P4.RAISE_ERRORS):
+            # Having nothing opened is only a warning
+            results = self.run_opened(f'{p4_escape(directory)}/...')
+        return [P4Path(p4_unescape(result['clientFile'])) for result in results]
+
+    def have_digests(self, directory: P4Path) -> dict[P4Path, Optional[str]]:
+        """The MD5 digests (in lower case) of the revisions of the files under directory that the client has, by workspace path"""
+        with self.lock, self.at_exception_level(P4.P4.RAISE_ERRORS):
+            # Having no files is only a warning
+            # -Op reports the workspace path (which clientFile gives in local syntax) as path
+            results = self.run_fstat('-Ol', '-Op', '-T', 'path,digest', f'{p4_escape(directory)}/...#have')
+        return {P4Path(p4_unescape(result['path'])): result['digest'].lower() if 'digest' in result else None for result in results}
+
+    def have_state(self, directory: P4Path) -> str:
+        """A digest of which revisions of the files under directory the client has, which changes whenever any of them is synced"""
+        with self.lock, self.at_exception_level(P4.P4.RAISE_ERRORS):
+            # Having no files is only a warning
+            results = self.run_have(f'{p4_escape(directory)}/...')
+        revisions = sorted(f"{result['depotFile']}#{result['haveRev']}" for result in results)
+        return hashlib.sha256('\n'.join(revisions).encode()).hexdigest()
+
+    def where(self, *paths: Path) -> list[P4Path]:
+        """
+        Look up the depot paths of local paths.
+
+        Paths that haven't been looked up before are all sent to the server in a single `p4 where`.
+        """
+        with self.lock:
+            cache = self._where_cache
+            # Paths are cached by their normcased form, but sent to the server as they were given
+            requested = {os.path.normcase(path): path for path in map(os.path.abspath, paths)}
+            keys = [os.path.normcase(os.path.abspath(path)) for path in paths]
+
+            missing = [key for key in requested if key not in cache]
+            # Every path beyond the first one sent to the server is a round trip saved
+            self.__dict__['round_trips_saved'] += len(set(keys)) - (1 if missing else 0)
+
+            if missing:
+                # Unmapped paths are only warnings (reported below), exclusionary mappings show up as extra results prefixed with '-'
+                with self.at_exception_level(P4.P4.RAISE_ERRORS):
+                    mappings = [mapping for mapping in self.run_where(*(requested[key] for key in missing)) if 'unmap' not in mapping]
+                for mapping in mappings:
+                    cache[os.path.normcase(mapping['path'])] = P4Path(mapping['depotFile'])
+                # The server spells paths from the client root, which differs from ours under an AltRoot or a symlinked directory.
+                # Each mapped path has one result in order, so when none are unmapped the results line up with the paths sent.
+                if len(mappings) == len(missing):
+                    for key, mapping in zip(missing, mappings):
+                        cache[key] = P4Path(mapping['depotFile'])
+                else:
+                    # Some path isn't mapped, so ask for the others one at a time rather than guess which result is whose
+                    for key in missing:
+                        if key not in cache:
+                            with self.at_exception_level(P4.P4.RAISE_ERRORS):
+                                mapped = [mapping for mapping in self.run_where(requested[key]) if 'unmap' not in mapping]
+                            if mapped:
+                                cache[key] = P4Path(mapped[0]['depotFile'])
+
+            try:
+                return [cache[key] for key in keys]
+            except KeyError as e:
+                raise Exception(f"{e.args[0]} is not mapped in client {self.client}") from None
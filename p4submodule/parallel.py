@@ -0,0 +1,40 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Optional
+
+class HostLimiter(object):
+    """
+    Limits how many network operations may run against a single remote host at once
+    """
+
+    per_host: Optional[int]
+    """The maximum number of concurrent operations per host (None for unlimited)"""
+
+    _semaphores: dict[str, threading.Semaphore]
+
+    _lock: threading.Lock
+
+    def __init__(self, per_host: Optional[int] = None) -> None:
+        self.per_host = per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def limit(self, host: Optional[str]) -> Iterator[None]:
+        """Blocks until a slot for host is available, and holds it for the duration of the with statement"""
+        if not self.per_host:
+            yield
+            return
+
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host or '', threading.Semaphore(self.per_host))
+
+        with semaphore:
+            yield
@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable
+from typing import Optional
+
+def _translate(pattern: str) -> str:
+    """
+    Turn a path pattern into a regular expression matching the paths (relative to the submodule) it selects.
+
+    `*` and `?` don't match `/`, `**` matches any number of directories. Like .gitignore, a pattern without a `/` (other
+    than a trailing one) matches at any depth, a pattern matching a directory matches everything under it, and a pattern
+    with a trailing `/` only matches directories.
+    """
+    anchored = '/' in pattern.rstrip('/')
+    directory = pattern.endswith('/')
+    pattern = pattern.strip('/')
+
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+
+    # Only files are matched, so a directory is matched through the paths under it
+    return ('' if anchored else '(?:.*/)?') + regex + ('/.*' if directory else '(?:/.*)?')
+
+def _compile(patterns: Iterable[str]) -> Optional[re.Pattern]:
+    regexes = [_translate(pattern) for pattern in patterns if pattern.strip('/')]
+    return re.compile('|'.join(f'(?:{regex})' for regex in regexes)) if regexes else None
+
+class PathFilter(object):
+    """
+    Selects the files of a submodule that are checked out and kept in P4, from its include and exclude patterns.
+
+    The git history is never filtered, so files that aren't selected stay in the repository's trees and index.
+    """
+
+    include: list[str]
+    """Only files matching one of these patterns are selected (all files are if it's empty)"""
+
+    exclude: list[str]
+    """Files matching any of these patterns aren't selected, even if they're included"""
+
+    def __init__(self, include: Optional[Iterable[str]] = None, exclude: Optional[Iterable[str]] = None) -> None:
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self._include = _compile(self.include)
+        self._exclude = _compile(self.exclude)
+
+    def __bool__(self) -> bool:
+        """Whether any files may be filtered out"""
+        return bool(self._include or self._exclude)
+
+    def matches(self, path: str) -> bool:
+        """Whether path (relative to the submodule, with / separators) is selected"""
+        if self._include and not self._include.fullmatch(path):
+            return False
+        return not (self._exclude and self._exclude.fullmatch(path))
+
+    def __repr__(self) -> str:
+        return f'PathFilter(include={self.include} exclude={self.exclude})'
@@ -0,0 +1,145 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Optional
+
+class Profiler(object):
+    """
+    Records the wall time of the phases of a run, and counters (bytes, objects, files, commands) about them, per submodule.
+
+    Disabled profilers record nothing, so instrumentation can be left in hot paths.
+    """
+
+    enabled: bool
+
+    _start: float
+
+    _events: list[dict[str, Any]]
+    """Completed phases, in Chrome's trace event format"""
+
+    _totals: dict[tuple[str, str], list]
+    """Maps (submodule, phase) to [calls, seconds]"""
+
+    _counters: dict[tuple[str, str], int]
+    """Maps (submodule, counter) to its total"""
+
+    _local: threading.local
+    """The submodule the current thread is working on"""
+
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything recorded so far"""
+        self._start = time.perf_counter()
+        self._events = []
+        self._totals = {}
+        self._counters = {}
+
+    @property
+    def submodule(self) -> str:
+        return getattr(self._local, 'submodule', '-')
+
+    def phase(self, name: str, submodule: Optional[str] = None, **args: Any) -> ContextManager[None]:
+        """
+        Time a phase. Phases started within it (on the same thread) are attributed to the same submodule.
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._phase(name, submodule, args)
+
+    @contextmanager
+    def _phase(self, name: str, submodule: Optional[str], args: dict[str, Any]) -> Iterator[None]:
+        previous = self.submodule
+        if submodule:
+            self._local.submodule = submodule
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            owner = self.submodule
+            self._local.submodule = previous
+
+            with self._lock:
+                totals = self._totals.setdefault((owner, name), [0, 0.0])
+                totals[0] += 1
+                totals[1] += elapsed
+                self._events.append({
+                    'name': name,
+                    'cat': owner,
+                    'ph': 'X',
+                    'ts': (start - self._start) * 1e6,
+                    'dur': elapsed * 1e6,
+                    'pid': os.getpid(),
+                    'tid': threading.get_ident(),
+                    'args': {'submodule': owner, **args},
+                })
+
+    def count(self, name: str, value: int, submodule: Optional[str] = None) -> None:
+        """Add value to a counter of the current (or given) submodule"""
+        if not self.enabled:
+            return
+        key = (submodule or self.submodule, name)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def totals(self) -> dict[str, dict[str, Any]]:
+        """The seconds and calls of each phase and the value of each counter, summed over every submodule"""
+        phases: dict[str, dict[str, Any]] = {}
+        for (_, name), (calls, seconds) in self._totals.items():
+            phase = phases.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            phase['calls'] += calls
+            phase['seconds'] += seconds
+
+        counters: dict[str, int] = {}
+        for (_, name), value in self._counters.items():
+            counters[name] = counters.get(name, 0) + value
+
+        return {'phases': phases, 'counters': counters}
+
+    def summary(self) -> str:
+        """A table of where the time went, slowest phases first, followed by the counters"""
+        lines = [f"{'Submodule':<24} {'Phase':<24} {'Calls':>8} {'Seconds':>10}"]
+        for (submodule, name), (calls, seconds) in sorted(self._totals.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{submodule:<24} {name:<24} {calls:>8} {seconds:>10.3f}")
+
+        if self._counters:
+            lines.append('')
+            lines.append(f"{'Submodule':<24} {'Counter':<24} {'Total':>19}")
+            for (submodule, name), value in sorted(self._counters.items()):
+                lines.append(f"{submodule:<24} {name:<24} {value:>19}")
+
+        return '\n'.join(lines)
+
+    def write_trace(self, path: Path) -> None:
+        """Write the phases as a Chrome trace (viewable in chrome://tracing or Perfetto), with the counters as metadata"""
+        counters: dict[str, dict[str, int]] = {}
+        for (submodule, name), value in self._counters.items():
+            counters.setdefault(submodule, {})[name] = value
+
+        with self._lock:
+            path.write_text(json.dumps({
+                'traceEvents': self._events,
+                'displayTimeUnit': 'ms',
+                'otherData': {'counters': counters},
+            }))
+
+profiler = Profiler()
+"""The profiler for the current process, enabled by --profile or --trace"""
@@ -0,0 +1,115 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import msgspec
+
+from .cache import cache_dir
+
+VERSION = 4
+
+class SubmoduleState(msgspec.Struct, omit_defaults=True):
+    """
+    The settings of a submodule as they are in its config file, and what was last learned about its remote
+    """
+
+    name: str
+
+    key: Optional[str] = None
+    """The submodule's table under [submodule], or None for the root-level settings"""
+
+    path: Optional[str] = None
+
+    remote: Optional[str] = None
+
+    tracking: Optional[str] = None
+
+    current_ref: Optional[str] = None
+
+    depth: Optional[int] = None
+
+    include: Optional[list[str]] = None
+
+    exclude: Optional[list[str]] = None
+
+    lfs: Optional[bool] = None
+
+    remote_head: Optional[str] = None
+    """The last known target of the remote's tracking branch"""
+
+    fetched_at: Optional[float] = None
+    """When the remote was last fetched (seconds since the epoch)"""
+
+    have_state: Optional[str] = None
+    """The revisions the client had of the submodule's files when it was last updated (see P4Context.have_state)"""
+
+class ConfigState(msgspec.Struct, omit_defaults=True):
+    """
+    The cached contents of a config file, valid for as long as the file matches its stamp
+    """
+
+    mtime_ns: int
+
+    size: int
+
+    digest: str
+    """The sha256 of the file's contents"""
+
+    submodules: list[SubmoduleState]
+
+    depot_paths: dict[str, str] = {}
+    """The depot path of the config's directory, keyed by '<P4PORT> <P4CLIENT>'"""
+
+class Stamp(NamedTuple):
+    """Identifies the contents of a config file"""
+    mtime_ns: int
+    size: int
+    digest: str
+
+def stamp(path: Path) -> Stamp:
+    """Stamp the current contents of a file (stat it before reading it, so a write in between leaves the stamp stale)"""
+    stat = path.stat()
+    return Stamp(stat.st_mtime_ns, stat.st_size, hashlib.sha256(path.read_bytes()).hexdigest())
+
+def _state_path(config_path: Path) -> Path:
+    key = hashlib.sha1(os.path.normcase(str(config_path)).encode()).hexdigest()
+    return cache_dir() / 'state' / f'v{VERSION}' / f'{key}.msgpack'
+
+def load(config_path: Path) -> Optional[ConfigState]:
+    """
+    Load the cached state of a config file, if it still describes the file.
+
+    The file is only read (to compare digests) when its mtime has changed but its size hasn't.
+    """
+    try:
+        state = msgspec.msgpack.decode(_state_path(config_path).read_bytes(), type=ConfigState)
+        stat = config_path.stat()
+    except (OSError, msgspec.DecodeError):
+        return None
+
+    if stat.st_size != state.size:
+        return None
+
+    if stat.st_mtime_ns != state.mtime_ns:
+        # Touched (by a P4 sync of the same revision, for example) but not necessarily changed
+        if hashlib.sha256(config_path.read_bytes()).hexdigest() != state.digest:
+            return None
+        state.mtime_ns = stat.st_mtime_ns
+
+    return state
+
+def save(config_path: Path, state: ConfigState) -> None:
+    """Cache the state of a config file, replacing the previous state atomically"""
+    path = _state_path(config_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    temp = path.with_suffix(f'.{os.getpid()}.tmp')
+    temp.write_bytes(msgspec.msgpack.encode(state))
+    os.replace(temp, path)
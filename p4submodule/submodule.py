@@ -4,48 +4,74 @@
 
 from __future__ import annotations
 
-from collections.abc import Callable
-from os.path import expanduser
+import hashlib
+import os
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Optional, TypeVar, TYPE_CHECKING
+from typing import Any, Optional, TypeVar, TYPE_CHECKING
 from urllib.parse import urlparse, urlunparse, ParseResult
 
 import click
 import pygit2
 import tomlkit.api
 import tomlkit.exceptions
-from paramiko.config import SSHConfig
-from pygit2.enums import BranchType, DescribeStrategy, MergeAnalysis, ResetMode
+from pygit2.enums import BranchType, CheckoutStrategy, DeltaStatus, DescribeStrategy, FileMode, FileStatus, MergeAnalysis, ResetMode
+
+from . import lfs
+from .changelist import Changelist, FileChanges
+from .credentials import AGENT, Credential, resolver
+from .mirror import set_tag_option
+from .path_filter import PathFilter
+from .profiling import profiler
+from .state import SubmoduleState
+from .verify import Checked, Expected, Mismatch, check_files
 
 if TYPE_CHECKING:
     from .config_file import ConfigFile
     from .p4_context import P4Path
+    from .mirror import MirrorCache
+    from .parallel import HostLimiter
     T = TypeVar('T')
 
 URL = ParseResult
 
+# libgit2's GIT_FETCH_DEPTH_UNSHALLOW
+UNSHALLOW_DEPTH = 2147483647
+
 class MyRemoteCallbacks(pygit2.RemoteCallbacks):
 
     def __init__(self, progress_bar: Optional[click.termui.ProgressBar], credentials = None, certificate = None) -> None:
         super().__init__(credentials, certificate)
         self.progress_bar = progress_bar
+        # libgit2 calls credentials() again whenever a key is rejected, so each host works through its list of keys
+        self._remaining: dict[str, Iterator[Credential]] = {}
 
     def credentials(self, url_str, username_from_url, allowed_types):
-        url = urlparse(url_str)
+        host = urlparse(url_str).hostname or ''
+        username = username_from_url or resolver.username(host)
 
         if allowed_types & pygit2.enums.CredentialType.USERNAME:
-            return pygit2.Username(username_from_url)
+            return pygit2.Username(username)
 
         elif allowed_types & pygit2.enums.CredentialType.SSH_KEY:
-            ssh_config_path = Path(expanduser('~/.ssh/config'))
-            if not ssh_config_path.exists():
-                config = SSHConfig.from_path(str(ssh_config_path))
-                if url_config := config.lookup(url.hostname):
-                    if privkey := url_config.get('identityfile'):
-                        return pygit2.Keypair(username_from_url, expanduser(privkey) + ".pub", expanduser(privkey), "")
+            if host not in self._remaining:
+                self._remaining[host] = iter(resolver.credentials(host))
+
+            credential = next(self._remaining[host], None)
+            if credential is None:
+                tried = ', '.join(str(credential) for credential in resolver.credentials(host)) or "none found"
+                raise Exception(f"{host} didn't accept any SSH key for {username} (tried: {tried})")
 
-            # Attempt default ssh keys
-            return pygit2.Keypair(username_from_url, expanduser("~/.ssh/id_rsa.pub"), expanduser("~/.ssh/id_rsa"), "")
+            resolver.offered(host, credential)
+            if credential == AGENT:
+                return pygit2.KeypairFromAgent(username)
+
+            private_key = Path(credential)
+            public_key = private_key.with_name(private_key.name + '.pub')
+            # libssh2 can derive the public key from the private one when there's no .pub file
+            return pygit2.Keypair(username, str(public_key) if public_key.exists() else None, str(private_key), "")
 
         else:
             return None
@@ -55,26 +81,70 @@ class MyRemoteCallbacks(pygit2.RemoteCallbacks):
             self.progress_bar.length = stats.total_objects
             self.progress_bar.update(stats.indexed_objects - self.progress_bar._completed_intervals)
 
+class FetchOptions(object):
+    """
+    Controls how submodules talk to their remotes
+    """
+
+    show_progress: bool
+    """Whether to display progress bars (should be disabled when fetching several remotes at once)"""
+
+    host_limiter: Optional[HostLimiter]
+    """Bounds the number of simultaneous fetches from the same host"""
+
+    mirror: Optional[MirrorCache]
+    """The shared mirror to fetch remotes through (if any)"""
+
+    tags: bool
+    """Whether to fetch the tags pointing into the tracking branch's history (used to annotate current_ref)"""
+
+    lfs: bool
+    """Whether to download LFS objects at all (submodules can also opt out with Submodule.lfs)"""
+
+    lfs_jobs: int
+    """The number of LFS objects to download at once"""
+
+    from_cache: bool
+    """Whether to use only what has already been fetched (see Submodule.prefetch), without any network access"""
+
+    def __init__(self, show_progress: bool = True, host_limiter: Optional[HostLimiter] = None, mirror: Optional[MirrorCache] = None, tags: bool = False, lfs: bool = True,
+                 lfs_jobs: int = 8, from_cache: bool = False) -> None:
+        self.show_progress = show_progress
+        self.host_limiter = host_limiter
+        self.mirror = mirror
+        self.tags = tags
+        self.lfs = lfs
+        self.lfs_jobs = lfs_jobs
+        self.from_cache = from_cache
+
 def _toml_property(key: str, reader: Callable[[str], T] = lambda x: x, writer: Callable[[T], str] = lambda x: x) -> property:
     """Helper for generating properties accessing a toml table"""
     cache_key = f'_{key}'
     def _get(self: Submodule):
-        if cached := getattr(self, cache_key, None):
-            return cached
+        # Values are cached once read, or up front when the submodule comes from the cached state (see from_state)
+        try:
+            return getattr(self, cache_key)
+        except AttributeError:
+            pass
         try:
             result = reader(self._table[key])
-            setattr(self, cache_key, result)
-            return result
         except tomlkit.exceptions.NonExistentKey:
-            return None
+            result = None
+        setattr(self, cache_key, result)
+        return result
 
     def _set(self, new):
         setattr(self, cache_key, new)
-        self._table[key] = writer(new)
+        # Submodules sharing a config file may be updated from several threads
+        with self._config.lock:
+            self._table[key] = writer(new)
+            self._config.modified = True
 
     def _del(self):
         setattr(self, cache_key, None)
-        return self._table.__delitem__(key)
+        with self._config.lock:
+            self._config.modified = True
+            return self._table.__delitem__(key)
 
     return property(_get, _set, _del)
 
@@ -83,17 +153,39 @@ class Submodule(object):
     Represents the configuration of a submodule
     """
 
+    # Configs may hold many submodules, so keep them compact. _toml_property caches values in '_<key>' slots.
+    __slots__ = ('name', '_config', '_key', '_container', '_repository', '_remote_head', '_last_remote_head', '_fetched_at', '_have_state',
+                 '_path_filter', '_path', '_remote', '_tracking', '_current_ref', '_depth', '_include', '_exclude', '_lfs')
+
     name: str
     """The Name of the submodule (defaults to the directory the config file lives in)"""
 
     _config: ConfigFile
     """The config file this submodule came from"""
 
-    _table: tomlkit.api.Container
-    """The table describing the configuration of the submodule"""
+    _key: Optional[str]
+    """The submodule's table under [submodule] in the config file, or None if it's configured by the root-level settings"""
+
+    _container: Optional[tomlkit.api.Container]
+    """The table describing the configuration of the submodule (see _table)"""
 
-    _repo: Optional[pygit2.Repository]
-    """The git repository for the submodule (if it exists)"""
+    _repository: Optional[pygit2.Repository] | bool
+    """The git repository for the submodule (if it exists), or False if it hasn't been looked for yet (see _repo)"""
+
+    _remote_head: Optional[pygit2.Oid]
+    """The last advertised target of the remote's tracking branch (see remote_head())"""
+
+    _last_remote_head: Optional[str]
+    """The last known target of the remote's tracking branch, from this run or a previous one (see last_remote_head)"""
+
+    _fetched_at: Optional[float]
+    """When the remote was last fetched"""
+
+    _have_state: Optional[str]
+    """The revisions the client had of the submodule's files when it was last updated (see P4Context.have_state)"""
+
+    _path_filter: Optional[PathFilter]
+    """Built from include and exclude when first needed (see path_filter)"""
 
     # The below come from the config
 
@@ -109,18 +201,112 @@ class Submodule(object):
     current_ref: Optional[pygit2.Oid] = _toml_property('current_ref', lambda str: pygit2.Oid(hex=str), lambda oid: oid.raw.hex()) # type: ignore
     """The currently synced revision"""
 
-    def __init__(self, name: Optional[str], config: ConfigFile, table: tomlkit.api.Container, path: Optional[Path] = None) -> None:
+    depth: Optional[int] = _toml_property('depth', int, int) # type: ignore
+    """The number of commits of history to fetch (None for the full history)"""
+
+    include: Optional[list[str]] = _toml_property('include', lambda patterns: [str(pattern) for pattern in patterns], list) # type: ignore
+    """Patterns selecting the files to check out and add to P4 (None for every file, see PathFilter)"""
+
+    exclude: Optional[list[str]] = _toml_property('exclude', lambda patterns: [str(pattern) for pattern in patterns], list) # type: ignore
+    """Patterns for files to leave out of the working tree and P4, even if they're included"""
+
+    lfs: Optional[bool] = _toml_property('lfs', bool, bool) # type: ignore
+    """Whether to download LFS objects (None for yes); when false, files tracked by LFS are left as pointers"""
+
+    MAX_DEPTH = 1024
+    """When deepening a shallow repository past this many commits, fetch the full history instead"""
+
+    def __init__(self, name: Optional[str], config: ConfigFile, table: Optional[tomlkit.api.Container], path: Optional[Path] = None, key: Optional[str] = None) -> None:
         self._config = config
-        self._table = table
+        self._key = key
+        self._container = table
+        self._remote_head = None
+        self._last_remote_head = None
+        self._fetched_at = None
+        self._have_state = None
+        self._path_filter = None
         if path:
             self.path = path
 
         self.name = name or self.local_path.name
 
-        if repo_path := pygit2.discover_repository(str(self.local_path)):
-            self._repo = pygit2.Repository(repo_path)
-        else:
-            self._repo = None
+        # The repository is only opened once it's needed
+        self._repository = False
+
+    @staticmethod
+    def from_state(config: ConfigFile, state: SubmoduleState) -> Submodule:
+        """Create a submodule from the cached state of its config file, without parsing the file"""
+        new = Submodule(state.name, config, None, key=state.key)
+        new._path = Path(state.path) if state.path else None
+        new._remote = urlparse(state.remote) if state.remote else None
+        new._tracking = state.tracking
+        new._current_ref = pygit2.Oid(hex=state.current_ref) if state.current_ref else None
+        new._depth = state.depth
+        new._include = state.include
+        new._exclude = state.exclude
+        new._lfs = state.lfs
+        new._last_remote_head = state.remote_head
+        new._fetched_at = state.fetched_at
+        new._have_state = state.have_state
+        return new
+
+    def state(self) -> SubmoduleState:
+        """The submodule's settings (and what was learned about its remote) for caching"""
+        # Values read from the document are tomlkit items, which only msgspec's builtin types can stand in for
+        return SubmoduleState(
+            name=str(self.name),
+            key=str(self._key) if self._key else None,
+            path=str(self.path) if self.path else None,
+            remote=self.remote.geturl() if self.remote else None,
+            tracking=str(self.tracking) if self.tracking else None,
+            current_ref=str(self.current_ref) if self.current_ref else None,
+            depth=self.depth,
+            include=self.include,
+            exclude=self.exclude,
+            lfs=self.lfs,
+            remote_head=self._last_remote_head,
+            fetched_at=self._fetched_at,
+            have_state=self._have_state,
+        )
+
+    @property
+    def _table(self) -> tomlkit.api.Container:
+        """The table describing the configuration of the submodule, which parses the config file on first access"""
+        if self._container is None:
+            self._container = self._config.table(self._key)
+        return self._container
+
+    @property
+    def path_filter(self) -> PathFilter:
+        """Selects the files of the repository that belong in the working tree and P4"""
+        # Rebuilt if the patterns have been changed (by create, for example)
+        if self._path_filter is None or (self._path_filter.include, self._path_filter.exclude) != (self.include or [], self.exclude or []):
+            self._path_filter = PathFilter(self.include, self.exclude)
+        return self._path_filter
+
+    @property
+    def last_remote_head(self) -> Optional[pygit2.Oid]:
+        """The last known target of the remote's tracking branch, which may have been learned by a previous run"""
+        return pygit2.Oid(hex=self._last_remote_head) if self._last_remote_head else None
+
+    @property
+    def fetched_at(self) -> Optional[float]:
+        """When the remote was last fetched (seconds since the epoch), by this run or a previous one"""
+        return self._fetched_at
+
+    @property
+    def _repo(self) -> Optional[pygit2.Repository]:
+        """The git repository for the submodule (if it exists)"""
+        if self._repository is False:
+            if repo_path := pygit2.discover_repository(str(self.local_path)):
+                self._repository = pygit2.Repository(repo_path)
+            else:
+                self._repository = None
+        return self._repository
+
+    @_repo.setter
+    def _repo(self, repo: Optional[pygit2.Repository]) -> None:
+        self._repository = repo
 
     @property
     def local_path(self) -> Path:
@@ -143,163 +329,714 @@ class Submodule(object):
 
 
     def _p4_add_index(self, change_num: int) -> None:
-        self._config._p4.run_add("-c", str(change_num), "-I", *[(self.ws_path / e.path).as_posix() for e in self._repo.index])
+        ws_path = self.ws_path
+        path_filter = self.path_filter
+        index = self._repo.index
+        # Streamed to run_batched, so large indexes never have their paths built in memory
+        paths = ((ws_path / entry.path).as_posix() for entry in index if path_filter.matches(entry.path))
+        total = sum(1 for entry in index if path_filter.matches(entry.path)) if path_filter else len(index)
+
+        start = time.perf_counter()
+        with click.progressbar(
+                label="Adding to P4...",
+                show_percent=True,
+                length=total,
+            ) as progress_bar, profiler.phase('p4 add'):
+            count = self._config.p4.run_batched('add', ["-c", str(change_num), "-I", "-f"], paths, on_batch=progress_bar.update)
+        elapsed = time.perf_counter() - start
+
+        print(f"[{self.name}] Added {count} files in {elapsed:.1f}s ({count / max(elapsed, 0.001):.0f} files/s)")
+
+    def _diff_changes(self, base: pygit2.Oid, *targets: pygit2.Oid) -> FileChanges:
+        """
+        Work out which files differ between base and each of targets, as the P4 operations needed to update the working tree.
+        """
+        changes = FileChanges()
+        ws_path = lambda path: (self.ws_path / path).as_posix()
+        matches = self.path_filter.matches
+
+        for target in targets:
+            diff = self._repo.diff(base, target)
+            diff.find_similar()
+
+            for delta in diff.deltas:
+                # Files the path filter leaves out are never in P4, so renames across it become adds or deletes
+                old = delta.status != DeltaStatus.ADDED and matches(delta.old_file.path)
+                new = delta.status != DeltaStatus.DELETED and matches(delta.new_file.path)
+
+                if delta.status == DeltaStatus.RENAMED and old and new:
+                    changes.moves[ws_path(delta.old_file.path)] = ws_path(delta.new_file.path)
+                elif delta.status in (DeltaStatus.RENAMED, DeltaStatus.ADDED, DeltaStatus.DELETED):
+                    if old:
+                        changes.deletes[ws_path(delta.old_file.path)] = None
+                    if new:
+                        changes.adds[ws_path(delta.new_file.path)] = None
+                elif new:
+                    changes.edits[ws_path(delta.new_file.path)] = None
+
+        # The same file may be touched by several targets, the most destructive operation wins
+        changes.edits = {path: None for path in changes.edits if path not in changes.deletes and path not in changes.moves}
+        # Files that are moved into place are already opened by the move
+        destinations = set(changes.moves.values())
+        changes.adds = {path: None for path in changes.adds if path not in destinations}
+
+        return changes
+
+    def _local_changes(self, full_scan: bool = False) -> list[str]:
+        """
+        Find the files that differ from the index, as paths relative to the submodule.
+
+        Files in a P4 workspace are read-only until they're opened, so only the files opened under the submodule are
+        checked, unless full_scan is set (for files made writable without opening them, or synced to revisions git doesn't have).
+        """
+        if full_scan:
+            candidates = self._repo.status()
+        else:
+            candidates = {}
+            for path in self._config.p4.opened(self.ws_path):
+                relative = path.relative_to(self.ws_path).as_posix()
+                try:
+                    candidates[relative] = self._repo.status_file(relative)
+                except KeyError:
+                    # Opened for delete, and not known to git either
+                    pass
+        profiler.count('files checked', len(candidates))
+
+        # Files left out by the path filter are missing from the working tree, but aren't deleted
+        config_path = self._config_path()
+        path_filter = self.path_filter
+        return [
+            path for path, status in candidates.items()
+            if status not in (FileStatus.CURRENT, FileStatus.IGNORED) and path != config_path and path_filter.matches(path)
+        ]
+
+    def _config_path(self) -> Optional[str]:
+        """The path of the config file relative to the submodule, if it's inside it (a root submodule shares its directory with the config, which isn't part of the repo)"""
+        return self._config.path.relative_to(self.local_path).as_posix() if self._config.path.is_relative_to(self.local_path) else None
 
 
     # Functionality
 
-    def clone(self, change_num: int) -> pygit2.Repository:
+    def clone(self, change_num: int, options: Optional[FetchOptions] = None) -> pygit2.Repository:
         """Clone the submodule into the relevant directory (directory _cannot_ already exist)"""
-        if self._repo:
-            raise Exception("Cannot clone() submodule that is already cloned!")
+        with profiler.phase('clone', submodule=self.name):
+            if self._repo:
+                raise Exception("Cannot clone() submodule that is already cloned!")
 
-        with click.progressbar(
-                label="Cloning...",
-                show_percent=True,
-                length=100,
-            ) as progress_bar:
-            self._repo = pygit2.clone_repository(
-                self.remote.geturl(),
-                str(self.local_path),
-                checkout_branch=self.tracking,
-                # depth=1, # NOTE: This breaks everything
-                callbacks=MyRemoteCallbacks(progress_bar))
-
-        # If user didn't specify a tracking branch, populate it from the default cloned
-        if not self.tracking:
-            self.tracking = self._repo.head.shorthand
+            options = options or FetchOptions()
 
-        self.current_ref = self._repo.head.resolve().target
+            self._clone_tracking(options)
 
-        self._p4_add_index(change_num)
+            self.current_ref = self._repo.head.resolve().target
 
-        return self._repo
+            self._p4_add_index(change_num)
 
+            return self._repo
 
-    def update(self, change_number: int, commit_message: Optional[str] = None) -> bool:
-        if not self.current_ref:
-            raise Exception("Repo is missing current_ref, cannot update!")
 
-        tracking_branch: Optional[pygit2.Branch] = None
-        remote_name: Optional[str] = None
-        if self._repo:
-            tracking_branch = self._repo.lookup_branch(self.tracking, BranchType.LOCAL)
-            if tracking_branch and tracking_branch.upstream:
-                remote_name = tracking_branch.upstream.remote_name
-            elif self._repo.remotes:
-                remote_name = next((remote.name for remote in self._repo.remotes if remote.url == self.remote.geturl()), "origin")
+    def _clone_tracking(self, options: FetchOptions) -> None:
+        """Clone only the tracking branch (like git clone --single-branch)"""
+        self._repo = pygit2.init_repository(
+            path=self.local_path,
+            origin_url=self.remote.geturl(),
+        )
 
-        else:
-            self._repo = pygit2.init_repository(
-                path=self.local_path,
-                origin_url=self.remote.geturl(),
-                initial_head=self.tracking,
-            )
-            remote_name = 'origin'
-
-        # Fetch latest changes
-        with click.progressbar(
+        if not self.tracking:
+            # Use the remote's default branch, like clone_repository would
+            remote_head = next(head for head in self._ls_remote('origin', options) if head['name'] == 'HEAD')
+            self.tracking = remote_head['symref_target'].removeprefix('refs/heads/')
+
+        self._fetch('origin', options, self.depth)
+
+        remote_tracking = self._repo.lookup_branch(f'origin/{self.tracking}', BranchType.REMOTE)
+        tracking_branch = self._repo.create_branch(self.tracking, remote_tracking.peel(pygit2.Commit))
+        tracking_branch.upstream = remote_tracking
+
+        if not self.path_filter:
+            # LFS objects have to be available before checkout can smudge them
+            self._lfs_fetch(remote_tracking.target, options)
+            with profiler.phase('checkout'):
+                self._repo.checkout(tracking_branch)
+            return
+
+        # The index holds the whole tree, but only the selected files are written to the working tree
+        self._repo.index.read_tree(remote_tracking.peel(pygit2.Tree))
+        self._repo.index.write()
+        self._repo.set_head(tracking_branch.name)
+
+        paths = [entry.path for entry in self._repo.index if self.path_filter.matches(entry.path)]
+        self._lfs_fetch(remote_tracking.target, options, paths)
+        with profiler.phase('checkout', files=len(paths)):
+            self._checkout(remote_tracking.target, paths)
+
+    def _ls_remote(self, remote_name: str, options: FetchOptions) -> list[dict]:
+        """List the refs advertised by the remote"""
+        with options.host_limiter.limit(self.remote.hostname) if options.host_limiter else nullcontext(), profiler.phase('ls-remote'):
+            return self._repo.remotes[remote_name].ls_remotes(callbacks=MyRemoteCallbacks(None))
+
+    def _fetch(self, remote_name: str, options: FetchOptions, depth: Optional[int] = None) -> None:
+        progress = click.progressbar(
                 label=f"Fetching {remote_name}...",
                 show_percent=True,
                 length=100,
-            ) as progress_bar:
-            self._repo.remotes[remote_name].fetch(callbacks=MyRemoteCallbacks(progress_bar))
-
-        if not tracking_branch:
-            tracking_branch = self._repo.create_branch(self.tracking, self._repo[self.current_ref].peel(pygit2.Commit))
-            self._repo.reset(self.current_ref, ResetMode.MIXED)
-
-        remote_tracking = self._repo.lookup_branch(f'{remote_name}/{self.tracking}', BranchType.REMOTE)
+            ) if options.show_progress else nullcontext(None)
+        with options.host_limiter.limit(self.remote.hostname) if options.host_limiter else nullcontext(), progress as progress_bar, profiler.phase('fetch', depth=depth):
+            # Only the tracking branch is fetched, other branches (and tags, unless asked for) can be very numerous
+            refspecs = [f'+refs/heads/{self.tracking}:refs/remotes/{remote_name}/{self.tracking}']
+            if options.mirror:
+                # Fetch the remote into the mirror, then update our refs from the mirror with no network access
+                mirror_path = options.mirror.fetch(self.remote.geturl(), MyRemoteCallbacks(progress_bar), self.tracking, options.tags)
+                options.mirror.attach(self._repo, self.remote.geturl())
+
+            # libgit2 can't fetch into a shallow repository from a local mirror, so those still fetch from the remote
+            if options.mirror and not self._repo.is_shallow:
+                if options.tags:
+                    refspecs.append('+refs/tags/*:refs/tags/*')
+                stats = self._repo.remotes.create_anonymous(str(mirror_path)).fetch(refspecs)
+            else:
+                set_tag_option(self._repo, remote_name, options.tags)
+                stats = self._repo.remotes[remote_name].fetch(refspecs, callbacks=MyRemoteCallbacks(progress_bar), depth=depth or 0)
+
+            profiler.count('bytes fetched', stats.received_bytes)
+            profiler.count('objects fetched', stats.received_objects)
+
+        self._fetched_at = time.time()
+        if remote_tracking := self._repo.references.get(f'refs/remotes/{remote_name}/{self.tracking}'):
+            self._last_remote_head = str(remote_tracking.target)
+
+    def _lfs_fetch(self, commit: pygit2.Oid, options: FetchOptions, paths: Optional[list[str]] = None) -> None:
+        """
+        Download the LFS objects for the pointers in commit (limited to paths), unless LFS was opted out of (with
+        FetchOptions.lfs or Submodule.lfs), in which case the files are checked out as their pointers.
+        """
+        if not options.lfs or self.lfs is False:
+            return
+
+        if options.from_cache:
+            if missing := lfs.missing(self._repo, commit, paths):
+                raise Exception(f"{len(missing)} LFS objects needed by {commit} haven't been fetched (run prefetch first)")
+            return
+
+        start = time.perf_counter()
+        with profiler.phase('lfs fetch'):
+            try:
+                count, size = lfs.fetch(self._repo, commit, self.remote.geturl(), paths, options.lfs_jobs)
+            except lfs.LfsAuthenticationError as e:
+                # Pointers must never be added to P4 in place of the files, unless that was asked for
+                raise Exception(f"{e} (pass --no-lfs or set lfs = false to leave the files tracked by LFS as pointers)") from None
+        profiler.count('lfs objects fetched', count)
+        profiler.count('lfs bytes fetched', size)
+        if count:
+            print(f"[{self.name}] Downloaded {count} LFS objects ({size / 1024 / 1024:.1f} MiB) in {time.perf_counter() - start:.1f}s")
+
+    def _deepen(self, remote_name: str, options: FetchOptions, reachable: Callable[[], bool]) -> None:
+        """Fetch more of the history of a shallow repository until reachable() is satisfied"""
+        depth = self.depth or 1
+        while self._repo.is_shallow and not reachable():
+            if options.from_cache:
+                raise Exception(f"Not enough of {self.remote.geturl()}'s history has been fetched (run prefetch first)")
+
+            if depth == UNSHALLOW_DEPTH:
+                raise Exception(f"{self.remote.geturl()}'s full history doesn't reach what is needed")
+
+            depth *= 2
+            if depth >= Submodule.MAX_DEPTH:
+                depth = UNSHALLOW_DEPTH
+
+            print(f"[{self.name}] Deepening history to {depth if depth != UNSHALLOW_DEPTH else 'full'} commits")
+            self._fetch(remote_name, options, depth)
+
+    def _remote_name(self) -> Optional[str]:
+        """The name of the remote in the repository that the tracking branch comes from"""
+        tracking_branch = self._repo.lookup_branch(self.tracking, BranchType.LOCAL)
+        if tracking_branch and tracking_branch.upstream:
+            return tracking_branch.upstream.remote_name
+        elif self._repo.remotes:
+            return next((remote.name for remote in self._repo.remotes if remote.url == self.remote.geturl()), "origin")
+        return None
+
+    def remote_head(self, options: Optional[FetchOptions] = None) -> Optional[pygit2.Oid]:
+        """
+        The commit the remote's tracking branch currently points at, read from the remote's ref advertisement without fetching.
+
+        Returns None if there is no repository to ask through yet. The result is remembered for the rest of the run.
+        """
+        if self._remote_head is None and self._repo and (remote_name := self._remote_name()):
+            tracking_ref = f'refs/heads/{self.tracking}'
+            for head in self._ls_remote(remote_name, options or FetchOptions()):
+                if head['name'] == tracking_ref:
+                    self._remote_head = head['oid']
+                    self._last_remote_head = str(head['oid'])
+                    break
+            else:
+                raise Exception(f"Remote {self.remote.geturl()} has no branch {self.tracking}")
+
+        return self._remote_head
+
+    def is_up_to_date(self, options: Optional[FetchOptions] = None) -> bool:
+        """Cheaply check whether the remote's tracking branch has moved since the last update"""
+        return self.current_ref is not None and self.remote_head(options) == self.current_ref
+
+    def _describe(self, commit: Optional[pygit2.Oid]) -> Optional[str]:
+        try:
+            return self._repo.describe(str(commit), describe_strategy=DescribeStrategy.TAGS, max_candidates_tags=1) if commit else None
+        except (pygit2.GitError, KeyError):
+            return None
 
-        if remote_tracking.target == self.current_ref:
-            print("Up to date!")
+    def status(self, options: Optional[FetchOptions] = None, offline: bool = False) -> dict[str, Any]:
+        """
+        Summarize how the submodule compares to its remote, without fetching or modifying anything.
+
+        If offline is set, the remote isn't queried and the last known remote head is used instead.
+        """
+        with profiler.phase('status', submodule=self.name):
+            remote_head = self.last_remote_head if offline else self.remote_head(options)
+
+            behind: Optional[int] = None
+            current_describe: Optional[str] = None
+            remote_describe: Optional[str] = None
+            if self._repo:
+                current_describe = self._describe(self.current_ref)
+                # The remote head is only known locally if it has been fetched before
+                if remote_head and self.current_ref and remote_head in self._repo and self.current_ref in self._repo:
+                    _, behind = self._repo.ahead_behind(self.current_ref, remote_head)
+                    remote_describe = self._describe(remote_head)
+
+            return {
+                'name': self.name,
+                'path': str(self.local_path),
+                'remote': self.remote.geturl(),
+                'tracking': self.tracking,
+                'current_ref': str(self.current_ref) if self.current_ref else None,
+                'current_describe': current_describe,
+                'remote_head': str(remote_head) if remote_head else None,
+                'remote_describe': remote_describe,
+                'up_to_date': remote_head is not None and remote_head == self.current_ref,
+                'behind': behind,
+                'fetched_at': self.fetched_at,
+            }
+
+    def verify(self, jobs: int = 8, against_p4: bool = False) -> tuple[int, list[Mismatch]]:
+        """
+        Check that the working tree matches the tracking branch (current_ref, plus any local commits on top of it), and
+        if against_p4 is set, that the revisions the P4 client has match it too.
+
+        Returns the number of files checked and the files that don't match.
+        """
+        with profiler.phase('verify', submodule=self.name):
+            if not self._repo or not self.current_ref:
+                raise Exception(f"{self.local_path} has no git repository or current_ref to verify against")
+
+            head = self.current_ref
+            tracking_branch = self._repo.lookup_branch(self.tracking, BranchType.LOCAL)
+            if tracking_branch and self._repo.descendant_of(tracking_branch.target, self.current_ref):
+                head = tracking_branch.target
+
+            index = pygit2.Index()
+            index.read_tree(self._repo[head].peel(pygit2.Tree))
+            pointers = lfs.find_pointers(self._repo, head)
+            expected = {
+                entry.path: Expected(entry.path, str(entry.id), entry.mode == FileMode.LINK, pointers.get(entry.path))
+                for entry in index if entry.mode != FileMode.COMMIT and self.path_filter.matches(entry.path)
+            }
+
+            with profiler.phase('hash files', files=len(expected)):
+                checked = check_files(self.local_path, expected.values(), jobs)
+            profiler.count('files verified', len(checked))
+
+            mismatches = [Mismatch(result.path, result.problem) for result in checked if result.problem]
+            if against_p4:
+                mismatches.extend(self._verify_p4(expected, checked))
+
+            return len(checked), mismatches
+
+    def _verify_p4(self, expected: dict[str, Expected], checked: list[Checked]) -> list[Mismatch]:
+        """Compare the digests of the revisions the P4 client has with the files' contents in git"""
+        ws_path = self.ws_path
+        with profiler.phase('p4 digests'):
+            have = {path.relative_to(ws_path).as_posix(): digest for path, digest in self._config.p4.have_digests(ws_path).items()}
+            # Opened files are expected to differ from the revisions the client has
+            opened = {path.relative_to(ws_path).as_posix() for path in self._config.p4.opened(ws_path)}
+
+        mismatches: list[Mismatch] = []
+        for result in checked:
+            if result.path in opened:
+                continue
+            if result.path not in have:
+                mismatches.append(Mismatch(result.path, 'not in depot'))
+                continue
+
+            md5 = result.md5
+            # The working tree doesn't match git, so hash what git has instead (LFS contents may not be available)
+            if md5 is None and not expected[result.path].pointer:
+                md5 = hashlib.md5(self._repo[expected[result.path].blob].data).hexdigest()
+            if md5 and have[result.path] and md5 != have[result.path]:
+                mismatches.append(Mismatch(result.path, 'depot differs'))
+
+        for path in sorted(have.keys() - expected.keys() - opened - {self._config_path()}):
+            mismatches.append(Mismatch(path, 'not in git'))
+
+        return mismatches
+
+    def prefetch(self, options: Optional[FetchOptions] = None) -> Optional[pygit2.Oid]:
+        """
+        Fetch the remote's tracking branch, and the LFS objects and history an update to it will need, without touching the working tree or P4.
+
+        Afterwards the submodule can be updated with FetchOptions.from_cache. Returns the fetched target, or None if the submodule is up to date.
+        """
+        with profiler.phase('prefetch', submodule=self.name):
+            options = options or FetchOptions()
+
+            if not self._repo:
+                raise Exception(f"{self.local_path} has no git repository, create or update it first")
+
+            if self.is_up_to_date(options):
+                return None
+
+            remote_name = self._remote_name()
+            self._fetch(remote_name, options, self.depth)
+
+            target = self._repo.lookup_branch(f'{remote_name}/{self.tracking}', BranchType.REMOTE).target
+            if self.current_ref:
+                self._deepen(remote_name, options, lambda: self.current_ref in self._repo and self._repo.merge_base(self.current_ref, target) == self.current_ref)
+                # The LFS objects for the files an update to target will check out
+                paths = {path for delta in self._repo.diff(self.current_ref, target).deltas for path in (delta.old_file.path, delta.new_file.path)}
+                self._lfs_fetch(target, options, [path for path in paths if self.path_filter.matches(path)])
+
+            return target
+
+    def update(self, change_number: int, commit_message: Optional[str] = None, options: Optional[FetchOptions] = None, full_scan: bool = False) -> bool:
+        """Fetch the remote and move the submodule to the latest revision of the tracking branch"""
+        pending = self.prepare_update(commit_message, options, full_scan)
+        if not pending:
             return False
 
-        # Update the index to the last known commit
-        self._repo.reset(self.current_ref, ResetMode.MIXED)
-        tracking_branch = self._repo.lookup_branch(self.tracking)
-
-        # Check for uncommitted changes
-        if self._repo.status():
-            if not commit_message:
-                raise Exception("Unstaged changes, but commit message not provided!")
-
-            self._repo.index.add_all()
-            self._repo.index.write()
+        changelist = Changelist(self._config.p4, change_number)
+        try:
+            changelist.open(pending.changes)
+            self.apply_update(pending)
+            changelist.add(pending.changes)
+        except BaseException:
+            self.rollback_update(pending)
+            changelist.rollback()
+            raise
 
-            new_commit = self._repo.create_commit(
-                tracking_branch.name,
-                self._repo.default_signature,
-                self._repo.default_signature,
-                commit_message,
-                self._repo.index.write_tree(),
-                [tracking_branch.target])
+        return True
 
-            # Re-lookup branch since it's changed
+    def prepare_update(self, commit_message: Optional[str] = None, options: Optional[FetchOptions] = None, full_scan: bool = False) -> Optional[PendingUpdate]:
+        """
+        Fetch the remote and work out how to update the submodule, without touching the working tree or P4.
+
+        Local changes are committed to the tracking branch (see rollback_update). Returns None if the submodule is up to date.
+        Unless full_scan is set, only the files opened in P4 are checked for local changes, as long as the repository already existed
+        and the client has had the same revisions of the submodule's files since it was last updated.
+        """
+        with profiler.phase('prepare update', submodule=self.name):
+            options = options or FetchOptions()
+
+            if not self.current_ref:
+                raise Exception("Repo is missing current_ref, cannot update!")
+
+            if options.from_cache:
+                if not self._repo:
+                    raise Exception(f"{self.local_path} has no git repository, so nothing has been fetched to update from")
+
+            # Skip the fetch entirely when the remote hasn't moved
+            elif self.is_up_to_date(options):
+                print(f"[{self.name}] Up to date!")
+                return None
+
+            tracking_branch: Optional[pygit2.Branch] = None
+            remote_name: Optional[str] = None
+            created = False
+            if self._repo:
+                tracking_branch = self._repo.lookup_branch(self.tracking, BranchType.LOCAL)
+                remote_name = self._remote_name()
+
+            else:
+                self._repo = pygit2.init_repository(
+                    path=self.local_path,
+                    origin_url=self.remote.geturl(),
+                    initial_head=self.tracking,
+                )
+                remote_name = 'origin'
+                created = True
+
+            # Fetch latest changes
+            if not options.from_cache:
+                self._fetch(remote_name, options, self.depth)
+
+            if not tracking_branch:
+                self._deepen(remote_name, options, lambda: self.current_ref in self._repo)
+                tracking_branch = self._repo.create_branch(self.tracking, self._repo[self.current_ref].peel(pygit2.Commit))
+                self._repo.reset(self.current_ref, ResetMode.MIXED)
+                created = True
+
+            remote_tracking = self._repo.lookup_branch(f'{remote_name}/{self.tracking}', BranchType.REMOTE)
+            if not remote_tracking:
+                raise Exception(f"{remote_name}/{self.tracking} hasn't been fetched (run prefetch first)")
+
+            if remote_tracking.target == self.current_ref:
+                print(f"[{self.name}] Up to date!")
+                return None
+
+            # A shallow fetch of the remote may not reach back as far as the last commit we synced
+            self._deepen(remote_name, options, lambda: self._repo.merge_base(self.current_ref, remote_tracking.target) == self.current_ref)
+
+            # Update the index to the last known commit, keeping local commits made on top of it
+            tracking_branch = self._repo.lookup_branch(self.tracking)
+            original_target = self.current_ref
+            if self._repo.descendant_of(tracking_branch.target, self.current_ref):
+                original_target = tracking_branch.target
+            with profiler.phase('reset'):
+                self._repo.reset(original_target, ResetMode.MIXED)
             tracking_branch = self._repo.lookup_branch(self.tracking)
 
-            assert tracking_branch.target == new_commit, "New commit did not land correctly"
-
-            print(f"Committed local changes on branch {tracking_branch.name} as {new_commit}")
-
-        ahead, behind = self._repo.ahead_behind(tracking_branch.target, remote_tracking.target)
-        merge_analysis, _ = self._repo.merge_analysis(remote_tracking.target)
-        base = self._repo.merge_base(tracking_branch.target, remote_tracking.target)
-        assert base == self.current_ref, "Merge base should be the most recently pulled remote change"
-
-        print(f"Local branch is {ahead} commits ahead of remote, {behind} commits behind remote")
-
-        if merge_analysis & MergeAnalysis.UP_TO_DATE:
-            assert False, "This should have been caught above"
-
-        elif merge_analysis & MergeAnalysis.NONE:
-            raise Exception("No merge possible!")
-
-        elif merge_analysis & MergeAnalysis.FASTFORWARD:
-            assert ahead == 0
+            # Files synced to revisions git doesn't know about (patches submitted from other workspaces, say) differ from the
+            # index without being opened, so only a full scan finds them
+            have_state = self._config.p4.have_state(self.ws_path)
+            if not full_scan and (created or have_state != self._have_state):
+                print(f"[{self.name}] Checking every file for local changes, since the files in P4 may not match the repository")
+                full_scan = True
+
+            # Check for uncommitted changes
+            with profiler.phase('git status'):
+                local_changes = self._local_changes(full_scan)
+
+            if local_changes:
+                if not commit_message:
+                    raise Exception("Unstaged changes, but commit message not provided!")
+
+                for path in local_changes:
+                    if os.path.lexists(self.local_path / path):
+                        self._repo.index.add(path)
+                    else:
+                        self._repo.index.remove(path)
+                self._repo.index.write()
+
+                new_commit = self._repo.create_commit(
+                    tracking_branch.name,
+                    self._repo.default_signature,
+                    self._repo.default_signature,
+                    commit_message,
+                    self._repo.index.write_tree(),
+                    [tracking_branch.target])
+
+                # Re-lookup branch since it's changed
+                tracking_branch = self._repo.lookup_branch(self.tracking)
+
+                assert tracking_branch.target == new_commit, "New commit did not land correctly"
+
+                print(f"[{self.name}] Committed local changes on branch {tracking_branch.name} as {new_commit}")
+
+            ahead, behind = self._repo.ahead_behind(tracking_branch.target, remote_tracking.target)
+            merge_analysis, _ = self._repo.merge_analysis(remote_tracking.target)
+            base = self._repo.merge_base(tracking_branch.target, remote_tracking.target)
+            assert base == self.current_ref, "Merge base should be the most recently pulled remote change"
+
+            print(f"[{self.name}] Local branch is {ahead} commits ahead of remote, {behind} commits behind remote")
+
+            if merge_analysis & MergeAnalysis.UP_TO_DATE:
+                assert False, "This should have been caught above"
+
+            elif merge_analysis & MergeAnalysis.NONE:
+                raise Exception("No merge possible!")
+
+            elif merge_analysis & MergeAnalysis.FASTFORWARD:
+                assert ahead == 0
+
+            elif merge_analysis & MergeAnalysis.NORMAL:
+                assert ahead > 0
+
+            # Local commits are replayed along their first parents, merges are flattened into the commits they merged
+            local_commits: list[pygit2.Oid] = []
+            current_commit: pygit2.Commit = self._repo.head.peel(pygit2.Commit)
+            while current_commit.id != base:
+                if not current_commit.parents:
+                    raise Exception(f"Local branch {self.tracking} doesn't build on {base}, cannot rebase!")
+                local_commits.insert(0, current_commit.id)
+                current_commit = current_commit.parents[0]
+
+            try:
+                with profiler.phase('rebase', commits=len(local_commits)):
+                    head = self._rebase(local_commits, remote_tracking.target)
+            except BaseException:
+                self._restore_branch(original_target)
+                raise
+
+            # The working tree only needs the files that differ between the local head and the new head to be written
+            paths: dict[str, None] = {}
+            for delta in self._repo.diff(tracking_branch.target, head).deltas:
+                paths[delta.old_file.path] = None
+                paths[delta.new_file.path] = None
+
+            # LFS objects are downloaded up front, so checkout can smudge them and a failed download doesn't leave files opened in P4
+            self._lfs_fetch(head, options, [path for path in paths if self.path_filter.matches(path)])
+
+            with profiler.phase('diff'):
+                # Everything changed since the last update, including local changes that were just committed (which may not be opened yet)
+                changes = self._diff_changes(original_target, head, tracking_branch.target)
+            profiler.count('files changed', len(changes))
+
+            return PendingUpdate(
+                remote_branch=remote_tracking.branch_name,
+                target=remote_tracking.target,
+                base=base,
+                original_target=original_target,
+                local_head=tracking_branch.target,
+                head=head,
+                local_commits=local_commits,
+                behind=behind,
+                changes=changes,
+                paths=list(paths),
+                have_state=have_state,
+            )
 
-        elif merge_analysis & MergeAnalysis.NORMAL:
-            assert ahead > 0
+    def apply_update(self, pending: PendingUpdate) -> None:
+        """Move the working tree to a prepared update (the files in pending.changes must already be opened in P4)"""
+        with profiler.phase('apply update', submodule=self.name):
+            pending.applied = True
 
-        self._config.p4.run_edit('-c', str(change_number), self.ws_path / '...')
+            tracking_branch = self._repo.lookup_branch(self.tracking)
+            with profiler.phase('checkout', files=len(pending.paths)):
+                # Write just the files that changed, so every other file keeps its timestamp and stat cache
+                self._checkout(pending.head, pending.paths)
+                # Point the tracking branch (and so HEAD) at the remote branch, with the local commits on top
+                tracking_branch.set_target(pending.head)
+
+            if tag := self._describe(pending.target):
+                with self._config.lock:
+                    self._table['current_ref'].comment(tag)
+
+            print(f"[{self.name}] Updated {pending.behind} commits to {pending.remote_branch} ({pending.target})")
+
+            if pending.local_commits:
+                print(f"[{self.name}] Rebased {len(pending.local_commits)} local commits onto {pending.remote_branch} ({pending.head})")
+
+            # Update the current_ref and save it
+            self.current_ref = pending.target
+            self._have_state = pending.have_state
+
+    def rollback_update(self, pending: PendingUpdate) -> None:
+        """Undo a prepared (and possibly applied) update, restoring the tracking branch and any local changes"""
+        with profiler.phase('rollback update', submodule=self.name):
+            self._repo.state_cleanup()
+
+            if pending.applied:
+                # The local commit holds the working tree as it was before the update, and only pending.paths were written since.
+                # Checking out from the new head removes the files it added.
+                self._repo.lookup_branch(self.tracking).set_target(pending.head)
+                self._checkout(pending.local_head, pending.paths)
+                self.current_ref = pending.base
+                # Local changes that were found by a full scan are unopened again, so the next update has to look for them too
+                self._have_state = None
+
+            self._restore_branch(pending.original_target)
+
+    def _checkout(self, commit: pygit2.Oid, paths: Iterable[str]) -> None:
+        """
+        Write paths as they are in commit to the working tree and index, removing the ones commit doesn't have.
+
+        HEAD must be the commit the working tree was checked out from. Files the path filter leaves out are only updated in the index.
+        """
+        repo = self._repo
+        if not repo:
+            raise Exception(f"{self.local_path} has no git repository to check out into")
+
+        selected: list[str] = []
+        left_out: list[str] = []
+        for path in paths:
+            (selected if self.path_filter.matches(path) else left_out).append(path)
+
+        if selected:
+            repo.checkout_tree(repo[commit], paths=selected, strategy=CheckoutStrategy.FORCE | CheckoutStrategy.DISABLE_PATHSPEC_MATCH)
+
+        if left_out:
+            tree = repo[commit].peel(pygit2.Tree)
+            index = repo.index
+            for path in left_out:
+                if path in tree:
+                    index.add(pygit2.IndexEntry(path, tree[path].id, tree[path].filemode))
+                elif path in index:
+                    index.remove(path)
+            index.write()
+
+    def _restore_branch(self, original_target: pygit2.Oid) -> None:
+        """Uncommit local changes committed by prepare_update, leaving them in the working tree"""
+        self._repo.lookup_branch(self.tracking).set_target(original_target)
+        self._repo.reset(original_target, ResetMode.MIXED)
+
+    def _rebase(self, commits: list[pygit2.Oid], onto: pygit2.Oid) -> pygit2.Oid:
+        """
+        Replay commits on top of onto without touching the working tree or index, returning the new head.
+
+        Raises if any of them conflict, before anything has been written to disk.
+        """
+        head = onto
+        for oid in commits:
+            commit: pygit2.Commit = self._repo[oid].peel(pygit2.Commit)
+            index = self._repo.merge_trees(commit.parents[0].tree, self._repo[head].peel(pygit2.Tree), commit.tree)
+
+            if index.conflicts:
+                paths = sorted({entry.path for conflict in index.conflicts for entry in conflict if entry})
+                raise Exception(f"Local commit {commit.short_id} ({commit.message.splitlines()[0]}) conflicts with the remote in: {', '.join(paths)}")
+
+            head = self._repo.create_commit(None, commit.author, self._repo.default_signature, commit.message, index.write_tree(self._repo), [head])
+
+        return head
+
+class PendingUpdate(object):
+    """
+    An update of a submodule that has been fetched and planned, but not yet applied to the working tree
+    """
 
-        to_cherrypick: list[pygit2.Oid] = []
+    remote_branch: str
+    """The remote tracking branch being updated to"""
 
-        current_commit: pygit2.Commit = self._repo.head.peel(pygit2.Commit)
-        for _ in range(ahead):
-            to_cherrypick.insert(0, current_commit.id)
-            assert len(current_commit.parents) == 1, "Multi-parent commits are not supported!"
-            current_commit = current_commit.parents[0]
+    target: pygit2.Oid
+    """The commit being updated to"""
 
-        assert current_commit.id == base, "Found incorrect rebase base!"
+    base: pygit2.Oid
+    """The commit the submodule is being updated from (current_ref)"""
 
-        # Point the tracking branch at the remote branch
-        tracking_branch.set_target(remote_tracking.target)
-        # Update the index
-        self._repo.checkout(tracking_branch)
-        # Update the working tree
-        self._repo.reset(tracking_branch.target, ResetMode.HARD)
+    original_target: pygit2.Oid
+    """The target of the tracking branch before local changes were committed"""
 
-        try:
-            tag = self._repo.describe(describe_strategy=DescribeStrategy.TAGS, max_candidates_tags=1)
-            self._table['current_ref'].comment(tag)
+    local_head: pygit2.Oid
+    """The target of the tracking branch after local changes were committed"""
 
-        except pygit2.GitError:
-            pass
+    head: pygit2.Oid
+    """The commit the tracking branch ends up at: target with the local commits replayed on top"""
 
-        for commit in to_cherrypick:
-            self._repo.cherrypick(commit)
+    local_commits: list[pygit2.Oid]
+    """The local commits replayed on top of target (as they were before the rebase)"""
 
-        print(f"Updated {behind} commits to {remote_tracking.branch_name} ({remote_tracking.target})")
+    behind: int
+    """The number of commits being pulled from the remote"""
 
-        if to_cherrypick:
-            print(f"Files changed locally are staged in git's index (use \"git cherry-pick --continue\" in {self.local_path} to commit them)")
+    changes: FileChanges
+    """The files that have to be opened in P4 for the update"""
 
-        self._config.p4.run_revert('-c', str(change_number), '-a')
+    paths: list[str]
+    """The files in the working tree that differ between local_head and head"""
 
-        self._p4_add_index(change_number)
+    have_state: str
+    """The revisions the client had of the submodule's files when it was checked for local changes (see P4Context.have_state)"""
 
-        # Update the current_ref and save it
-        self.current_ref = remote_tracking.target
+    applied: bool
+    """Whether the working tree may have been modified"""
 
-        return True
+    def __init__(self, remote_branch: str, target: pygit2.Oid, base: pygit2.Oid, original_target: pygit2.Oid, local_head: pygit2.Oid,
+                 head: pygit2.Oid, local_commits: list[pygit2.Oid], behind: int, changes: FileChanges, paths: list[str], have_state: str) -> None:
+        self.remote_branch = remote_branch
+        self.target = target
+        self.base = base
+        self.original_target = original_target
+        self.local_head = local_head
+        self.head = head
+        self.local_commits = local_commits
+        self.behind = behind
+        self.changes = changes
+        self.paths = paths
+        self.have_state = have_state
+        self.applied = False
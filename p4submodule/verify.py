@@ -0,0 +1,110 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import mmap
+import os
+import stat
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from .lfs import LfsPointer
+
+MMAP_THRESHOLD = 4 * 1024 * 1024
+"""Files at least this large are mapped rather than read into memory"""
+
+CHUNK_SIZE = 256
+"""The number of files each task hashes, so small files don't drown in per-task overhead"""
+
+class Expected(NamedTuple):
+    """What a file in the working tree should be, according to git"""
+    path: str
+    blob: str
+    """The id of the file's blob"""
+    symlink: bool
+    pointer: Optional[LfsPointer]
+    """The LFS pointer stored in place of the file's contents, if it's tracked by LFS"""
+
+class Checked(NamedTuple):
+    """The result of checking a file in the working tree"""
+    path: str
+    problem: Optional[str]
+    """None if the file matches, otherwise 'missing' or 'modified'"""
+    md5: Optional[str]
+    """The MD5 of the file's contents as P4 would store them (when the file matches git)"""
+
+class Mismatch(NamedTuple):
+    """A file that doesn't match what it should be"""
+    path: str
+    problem: str
+    """'missing' or 'modified' in the working tree, or 'not in depot', 'not in git' or 'depot differs' for the client's have revisions"""
+
+@contextmanager
+def _contents(path: Path, size: int) -> Iterator[bytes | mmap.mmap]:
+    if size < MMAP_THRESHOLD:
+        yield path.read_bytes()
+        return
+
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+def _blob_id(data: bytes | mmap.mmap) -> str:
+    digest = hashlib.sha1(b'blob %d\0' % len(data))
+    digest.update(data)
+    return digest.hexdigest()
+
+def _check(root: Path, expected: Expected) -> Checked:
+    path = root / expected.path
+    try:
+        info = path.lstat()
+    except OSError:
+        return Checked(expected.path, 'missing', None)
+
+    if expected.symlink:
+        if not stat.S_ISLNK(info.st_mode):
+            return Checked(expected.path, 'modified', None)
+        target = os.fsencode(os.readlink(path))
+        return Checked(expected.path, None if _blob_id(target) == expected.blob else 'modified', hashlib.md5(target).hexdigest())
+
+    if not stat.S_ISREG(info.st_mode):
+        return Checked(expected.path, 'modified', None)
+
+    with _contents(path, info.st_size) as data:
+        if expected.pointer:
+            # The pointer itself is left in place of files whose LFS objects weren't downloaded
+            if data == expected.pointer.encode():
+                return Checked(expected.path, None, hashlib.md5(data).hexdigest())
+            if info.st_size != expected.pointer.size or hashlib.sha256(data).hexdigest() != expected.pointer.oid:
+                return Checked(expected.path, 'modified', None)
+            return Checked(expected.path, None, hashlib.md5(data).hexdigest())
+
+        if _blob_id(data) == expected.blob:
+            return Checked(expected.path, None, hashlib.md5(data).hexdigest())
+
+        # P4 clients with LineEnd set to local or win write text files with CRLF line endings
+        if data.find(b'\r\n') >= 0:
+            normalized = bytes(data).replace(b'\r\n', b'\n')
+            if _blob_id(normalized) == expected.blob:
+                return Checked(expected.path, None, hashlib.md5(normalized).hexdigest())
+
+    return Checked(expected.path, 'modified', None)
+
+def check_files(root: Path, files: Iterable[Expected], jobs: int = 8) -> list[Checked]:
+    """
+    Hash the files under root (on jobs threads) and compare them with their git blobs, or with the sha256 of LFS pointers.
+
+    hashlib releases the GIL while hashing, so threads scale with the number of cores as well as with I/O.
+    """
+    files = iter(files)
+    chunks = iter(lambda: list(itertools.islice(files, CHUNK_SIZE)), [])
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(lambda chunk: [_check(root, expected) for expected in chunk], chunks)
+        return [checked for chunk in results for checked in chunk]
@@ -0,0 +1,302 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import click
+import P4 # type: ignore
+import pygit2
+
+import p4submodule
+from p4submodule.cli import main as cli
+from p4submodule.p4_context import P4Context
+from p4submodule.profiling import profiler
+
+SCENARIOS = ('startup', 'create', 'update', 'noop')
+
+HEAVY_MODULES = ('P4', 'pygit2', 'paramiko', 'tomlkit')
+"""Modules that p4submodule --help must not import"""
+
+STARTUP_SCRIPT = """
+import contextlib, io, json, sys, time
+start = time.perf_counter()
+from p4submodule.cli import main
+with contextlib.redirect_stdout(io.StringIO()):
+    main(['--help'], standalone_mode=False)
+print(json.dumps({'seconds': time.perf_counter() - start, 'modules': [module for module in %r if module in sys.modules]}))
+"""
+
+class RecordingP4(P4Context):
+    """
+    Stands in for a P4 server: answers the commands p4submodule relies on and records how long each one took
+    """
+
+    def __init__(self, root: Path, calls: Optional[list[dict[str, Any]]] = None, lock: Optional[threading.Lock] = None) -> None:
+        super().__init__()
+        self.__dict__['root'] = root
+        self.__dict__['calls'] = calls if calls is not None else []
+        self.__dict__['calls_lock'] = lock or threading.Lock()
+        self.__dict__['next_change'] = 1
+        self.client = 'bench'
+        self.port = 'bench:1666'
+
+    def connect(self) -> P4Context:
+        return self
+
+    def disconnect(self) -> None:
+        pass
+
+    def connected(self) -> bool:
+        return False
+
+    def new_connection(self) -> P4Context:
+        return RecordingP4(self.root, self.calls, self.calls_lock)
+
+    def run(self, *args, **kargs):
+        command, *rest = [str(arg) for arg in args]
+        start = time.perf_counter()
+        with self.lock:
+            result = self._respond(command, rest)
+        with self.calls_lock:
+            self.calls.append({'command': command, 'files': len(rest), 'seconds': time.perf_counter() - start})
+        return result
+
+    def save_change(self, change) -> int:
+        with self.lock:
+            number = self.next_change
+            self.next_change += 1
+        with self.calls_lock:
+            self.calls.append({'command': 'change', 'files': 0, 'seconds': 0.0})
+        return number
+
+    def _respond(self, command: str, args: list[str]) -> list:
+        if command == 'clients':
+            return [{'client': self.client}]
+        if command == 'client':
+            return [{'Client': self.client, 'Root': str(self.root)}]
+        if command == 'change':
+            return [P4.Spec()]
+        if command == 'where':
+            results = []
+            for path in args:
+                relative = Path(path).relative_to(self.root).as_posix()
+                results.append({'path': path, 'depotFile': f'//depot/{relative}', 'clientFile': f'//{self.client}/{relative}'})
+            return results
+        return []
+
+class SyntheticRemote(object):
+    """
+    A local upstream repository with a configurable number of files and length of history
+    """
+
+    repo: pygit2.Repository
+
+    files: int
+
+    _rng: random.Random
+
+    _index: pygit2.Index
+
+    FILES_PER_DIRECTORY = 100
+
+    def __init__(self, path: Path, files: int, history: int, churn: int, seed: int = 0) -> None:
+        self.repo = pygit2.init_repository(str(path), bare=True, initial_head='main')
+        self.files = files
+        self._rng = random.Random(seed)
+        self._index = pygit2.Index()
+
+        for number in range(files):
+            self._write(self._path(number), number)
+        self._commit('Initial commit')
+
+        for revision in range(1, history):
+            self.churn(churn, f'Revision {revision}')
+
+    @property
+    def url(self) -> str:
+        return Path(self.repo.path).as_uri()
+
+    def churn(self, count: int, message: str) -> None:
+        """Commit a change that edits, adds and deletes count files between them"""
+        paths = [entry.path for entry in self._index]
+        for path in self._rng.sample(paths, min(count, len(paths))):
+            action = self._rng.random()
+            if action < 0.8:
+                self._write(path, self._rng.getrandbits(64))
+            elif action < 0.9:
+                self._index.remove(path)
+            else:
+                self.files += 1
+                self._write(self._path(self.files), self.files)
+        self._commit(message)
+
+    def _path(self, number: int) -> str:
+        return f'Source/Dir{number // SyntheticRemote.FILES_PER_DIRECTORY:05}/File{number:07}.cpp'
+
+    def _write(self, path: str, seed: int) -> None:
+        content = f'// {path}\n// {seed}\n'.encode() + bytes(256)
+        self._index.add(pygit2.IndexEntry(path, self.repo.create_blob(content), pygit2.enums.FileMode.BLOB))
+
+    def _commit(self, message: str) -> None:
+        signature = pygit2.Signature('Benchmark', 'benchmark@example.com', 0, 0)
+        parents = [self.repo.head.target] if not self.repo.head_is_unborn else []
+        tree = self._index.write_tree(self.repo)
+        self.repo.create_commit('refs/heads/main', signature, signature, message, tree, parents)
+
+def _run(workspace: Path, args: list[str], first_change: int) -> dict[str, Any]:
+    """Run a p4submodule command in the workspace, returning its timings"""
+    # Each run gets a fresh connection, so no server metadata is cached between them
+    p4 = RecordingP4(workspace)
+    p4.next_change = first_change
+    profiler.reset()
+
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    start = time.perf_counter()
+    try:
+        # The command's own output would drown out the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            cli.main(args, obj=p4, standalone_mode=False)
+    finally:
+        os.chdir(cwd)
+    seconds = time.perf_counter() - start
+
+    commands: dict[str, dict[str, Any]] = {}
+    for call in p4.calls:
+        command = commands.setdefault(call['command'], {'calls': 0, 'files': 0, 'seconds': 0.0})
+        command['calls'] += 1
+        command['files'] += call['files']
+        command['seconds'] += call['seconds']
+
+    return {
+        'seconds': seconds,
+        'p4_commands': len(p4.calls),
+        'p4_seconds': sum(call['seconds'] for call in p4.calls),
+        'p4': commands,
+        **profiler.totals(),
+    }
+
+def _startup(runs: int) -> dict[str, Any]:
+    """Time importing the CLI and printing its help in fresh interpreters, and find which heavy modules that loads"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([str(Path(p4submodule.__file__).parent.parent), *filter(None, [env.get('PYTHONPATH')])])
+
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT % (HEAVY_MODULES,)], env=env, check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output))
+
+    result = {
+        'scenario': 'startup',
+        'files': 0,
+        'seconds': statistics.median(sample['seconds'] for sample in samples),
+        'p4_commands': 0,
+        'modules': samples[0]['modules'],
+    }
+    print(f"{'startup':<8} {'':>14} {result['seconds']:>9.3f}s heavy modules: {', '.join(result['modules']) or 'none'}")
+    return result
+
+def _benchmark(files: int, history: int, churn: float, scenarios: list[str], work_dir: Path) -> list[dict[str, Any]]:
+    remote = SyntheticRemote(work_dir / 'remote.git', files, history, max(1, int(files * churn)))
+    workspace = work_dir / 'workspace'
+    plugin = workspace / 'Plugins' / 'Benchmark'
+    plugin.mkdir(parents=True)
+
+    results = []
+
+    def _record(scenario: str, args: list[str]) -> None:
+        result = _run(workspace, args, len(results) + 1)
+        results.append({'scenario': scenario, 'files': files, **result})
+        print(f"{scenario:<8} {files:>8} files {result['seconds']:>9.3f}s {result['p4_commands']:>6} P4 commands")
+
+    # Every scenario needs the submodule to exist
+    _record('create', ['create', str(plugin), '--remote', remote.url, '--tracking', 'main'])
+
+    if 'update' in scenarios:
+        remote.churn(max(1, int(files * churn)), 'Upstream change')
+        _record('update', ['update', str(plugin)])
+
+    if 'noop' in scenarios:
+        _record('noop', ['update', str(plugin)])
+
+    return [result for result in results if result['scenario'] in scenarios]
+
+def _compare(results: list[dict[str, Any]], baseline_path: Path) -> None:
+    baseline = {(result['scenario'], result['files']): result for result in json.loads(baseline_path.read_text())['results']}
+    print(f"\nCompared to {baseline_path}:")
+    for result in results:
+        if previous := baseline.get((result['scenario'], result['files'])):
+            ratio = result['seconds'] / max(previous['seconds'], 1e-9)
+            print(f"{result['scenario']:<8} {result['files']:>8} files {previous['seconds']:>9.3f}s -> {result['seconds']:>9.3f}s ({ratio:.2f}x)"
+                  f" {previous['p4_commands']:>6} -> {result['p4_commands']} P4 commands")
+
+@click.command()
+@click.option('--files', type=click.IntRange(min=1), multiple=True, default=[1000, 10000], show_default=True, help="The number of files in the synthetic remote (repeat for several sizes, e.g. --files 100000)")
+@click.option('--history', type=click.IntRange(min=1), default=10, show_default=True, help="The number of commits in the remote's history")
+@click.option('--churn', type=click.FloatRange(min=0, max=1), default=0.01, show_default=True, help="The fraction of files changed by each commit")
+@click.option('--scenario', 'scenarios', type=click.Choice(SCENARIOS), multiple=True, default=SCENARIOS, show_default=True, help="The scenarios to run")
+@click.option('--work-dir', type=click.Path(file_okay=False, path_type=Path), help="(defaults to a temporary directory) Where to create the remotes and workspaces")
+@click.option('--out', type=click.Path(dir_okay=False, path_type=Path), default='benchmark-results.json', show_default=True, help="The file to write the results to")
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False, path_type=Path), help="Results from a previous run to compare against")
+@click.option('--startup-budget', type=click.FloatRange(min=0), default=0.25, show_default=True, help="Fail if importing the CLI and printing its help takes longer than this many seconds, or loads a heavy dependency")
+def main(files: list[int], history: int, churn: float, scenarios: list[str], work_dir: Optional[Path], out: Path, compare: Optional[Path], startup_budget: float) -> None:
+    """Time p4submodule's startup, create, update and no-op update against synthetic local remotes and a recording P4 stand-in."""
+    root = Path(work_dir or tempfile.mkdtemp(prefix='p4submodule-benchmark-')).absolute()
+
+    # Keep the benchmark's caches out of the user's
+    os.environ['P4SUBMODULE_CACHE_DIR'] = str(root / 'cache')
+    profiler.enabled = True
+
+    results = []
+    if 'startup' in scenarios:
+        results.append(_startup(runs=5))
+
+    try:
+        for count in files if set(scenarios) - {'startup'} else []:
+            run_dir = root / str(count)
+            if run_dir.exists():
+                shutil.rmtree(run_dir)
+            results.extend(_benchmark(count, history, churn, list(scenarios), run_dir))
+    finally:
+        if not work_dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    out.write_text(json.dumps({
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'pygit2': pygit2.__version__,
+            'libgit2': pygit2.LIBGIT2_VERSION,
+            'platform': platform.platform(),
+            'history': history,
+            'churn': churn,
+        },
+        'results': results,
+    }, indent=2))
+    print(f"Wrote results to {out}")
+
+    if compare:
+        _compare(results, compare)
+
+    for result in results:
+        if result['scenario'] == 'startup' and (result['modules'] or result['seconds'] > startup_budget):
+            raise click.ClickException(f"Startup check failed: {result['seconds']:.3f}s (budget {startup_budget:.3f}s), heavy modules loaded: {', '.join(result['modules']) or 'none'}")
+
+if __name__ == '__main__':
+    main()
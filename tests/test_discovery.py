@@ -0,0 +1,65 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from p4submodule.discovery import ConfigIndex
+
+@pytest.fixture
+def tree(tmp_path: Path) -> Path:
+    root = tmp_path / 'ws'
+    for directory in ('Plugins/A', 'Plugins/B', 'Plugins/B/Nested/C', 'Other'):
+        (root / directory).mkdir(parents=True, exist_ok=True)
+        (root / directory / 'submodule.toml').touch()
+    (root / 'Plugins/A/.git').mkdir()
+    (root / 'Plugins/A/.git/submodule.toml').touch()
+    return root
+
+def _find(index: ConfigIndex, root: Path, pattern: str) -> list[Path]:
+    return sorted(path.relative_to(root) for path in index.find(str(root / pattern)))
+
+def test_find(tmp_path: Path, tree: Path) -> None:
+    index = ConfigIndex(tmp_path / 'index.json')
+    assert _find(index, tree, '**/submodule.toml') == [Path('Other/submodule.toml'), Path('Plugins/A/submodule.toml'),
+                                                       Path('Plugins/B/Nested/C/submodule.toml'), Path('Plugins/B/submodule.toml')]
+    assert _find(index, tree, 'Plugins/*/submodule.toml') == [Path('Plugins/A/submodule.toml'), Path('Plugins/B/submodule.toml')]
+
+def test_depth_limited_walk(tmp_path: Path, tree: Path) -> None:
+    index = ConfigIndex(tmp_path / 'index.json')
+    _find(index, tree, 'Plugins/*/submodule.toml')
+    # Directories below the pattern's last wildcard are never looked at
+    directories = index._roots[ConfigIndex._root_key(tree / 'Plugins', 1)]
+    assert sorted(directories) == ['.', 'A', 'B']
+
+def test_changes_are_found_after_reload(tmp_path: Path, tree: Path) -> None:
+    index = ConfigIndex(tmp_path / 'index.json')
+    _find(index, tree, '**/submodule.toml')
+    index.save()
+
+    (tree / 'Plugins/B/Nested/C/submodule.toml').unlink()
+    (tree / 'Other/D').mkdir()
+    (tree / 'Other/D/submodule.toml').touch()
+
+    index = ConfigIndex(tmp_path / 'index.json')
+    assert _find(index, tree, '**/submodule.toml') == [Path('Other/D/submodule.toml'), Path('Other/submodule.toml'),
+                                                       Path('Plugins/A/submodule.toml'), Path('Plugins/B/submodule.toml')]
+
+def test_save_replaces_atomically(tmp_path: Path, tree: Path) -> None:
+    path = tmp_path / 'index.json'
+    index = ConfigIndex(path)
+    _find(index, tree, '**/submodule.toml')
+    index.save()
+
+    assert json.loads(path.read_text())['version'] == ConfigIndex.VERSION
+    # No temporary file is left behind
+    assert sorted(os.listdir(tmp_path)) == ['index.json', 'ws']
+
+def test_corrupt_index(tmp_path: Path, tree: Path) -> None:
+    path = tmp_path / 'index.json'
+    path.write_text('{"version": 2, "roo')
+    assert len(_find(ConfigIndex(path), tree, '**/submodule.toml')) == 4
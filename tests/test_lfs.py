@@ -0,0 +1,184 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import base64
+import hashlib
+import json
+import threading
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import pygit2
+import pytest
+from pygit2.enums import CheckoutStrategy, FileMode
+
+from p4submodule import lfs
+from p4submodule.lfs import LfsAuthenticationError, LfsPointer, endpoint
+
+OID = '4d7a214614ab2935c943f9e0ff69d22eadbb8f32b1258daaa5e2ca24d17e2393'
+
+def test_parse_pointer() -> None:
+    pointer = LfsPointer.parse(f'version https://git-lfs.github.com/spec/v1\noid sha256:{OID}\nsize 12345\n'.encode())
+    assert pointer is not None
+    assert (pointer.oid, pointer.size) == (OID, 12345)
+    reparsed = LfsPointer.parse(pointer.encode())
+    assert reparsed is not None and reparsed.oid == OID
+
+def test_parse_pointer_with_extensions() -> None:
+    data = f'version https://git-lfs.github.com/spec/v1\next-0-foo sha256:{"0" * 64}\noid sha256:{OID}\nsize 1\n'.encode()
+    pointer = LfsPointer.parse(data)
+    assert pointer is not None and pointer.oid == OID
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'hello world\n',
+    f'version https://example.com/other\noid sha256:{OID}\nsize 1\n'.encode(),
+    f'version https://git-lfs.github.com/spec/v1\noid sha256:{OID[:-1]}\nsize 1\n'.encode(),
+    f'version https://git-lfs.github.com/spec/v1\noid sha256:{OID}\nsize 1\n'.encode() + b'x' * 1024,
+])
+def test_parse_not_pointer(data: bytes) -> None:
+    assert LfsPointer.parse(data) is None
+
+def _commit(tmp_path: Path, lfsconfig: Optional[str] = None, files: Optional[dict[str, bytes]] = None) -> tuple[pygit2.Repository, pygit2.Oid]:
+    repo = pygit2.init_repository(tmp_path / 'repo')
+    builder = repo.TreeBuilder()
+    if lfsconfig is not None:
+        builder.insert('.lfsconfig', repo.create_blob(lfsconfig.encode()), FileMode.BLOB)
+    for name, data in (files or {}).items():
+        builder.insert(name, repo.create_blob(data), FileMode.BLOB)
+    signature = pygit2.Signature('Test', 'test@example.com')
+    return repo, repo.create_commit('HEAD', signature, signature, 'test', builder.write(), [])
+
+@pytest.mark.parametrize('remote, expected', [
+    ('https://example.com/team/repo.git', 'https://example.com/team/repo.git/info/lfs'),
+    ('https://example.com/team/repo', 'https://example.com/team/repo.git/info/lfs'),
+    ('git@example.com:team/repo.git', 'https://example.com/team/repo.git/info/lfs'),
+    ('ssh://git@example.com:2222/team/repo.git', 'https://example.com/team/repo.git/info/lfs'),
+])
+def test_endpoint_from_remote(tmp_path: Path, remote: str, expected: str) -> None:
+    repo, commit = _commit(tmp_path)
+    assert endpoint(repo, commit, remote) == expected
+
+def test_endpoint_from_lfsconfig(tmp_path: Path) -> None:
+    repo, commit = _commit(tmp_path, '[lfs]\n\turl = https://lfs.example.com/repo\n')
+    assert endpoint(repo, commit, 'https://example.com/team/repo.git') == 'https://lfs.example.com/repo'
+
+    # The repository's own config takes precedence
+    repo.config['lfs.url'] = 'https://override.example.com/repo'
+    assert endpoint(repo, commit, 'https://example.com/team/repo.git') == 'https://override.example.com/repo'
+
+CONTENTS = b'large binary contents\n' * 100
+
+class _LfsServer(ThreadingHTTPServer):
+    """A stand-in LFS server holding CONTENTS, which can require basic auth"""
+
+    objects: dict[str, bytes]
+
+    authorization: Optional[str]
+    """The Authorization header batch requests must have (if any)"""
+
+    batch_requests: int
+
+class _LfsHandler(BaseHTTPRequestHandler):
+    server: _LfsServer
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        self.server.batch_requests += 1
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.server.authorization and self.headers.get('Authorization') != self.server.authorization:
+            self._respond(401, b'')
+            return
+
+        base = f'http://localhost:{self.server.server_port}'
+        objects = [{
+            'oid': obj['oid'],
+            'size': obj['size'],
+            'actions': {'download': {'href': f"{base}/objects/{obj['oid']}"}},
+        } if obj['oid'] in self.server.objects else {
+            'oid': obj['oid'],
+            'error': {'code': 404, 'message': 'Object does not exist'},
+        } for obj in request['objects']]
+        self._respond(200, json.dumps({'transfer': 'basic', 'objects': objects}).encode())
+
+    def do_GET(self) -> None:
+        self._respond(200, self.server.objects[self.path.rsplit('/', 1)[1]])
+
+    def _respond(self, code: int, body: bytes) -> None:
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def server(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[_LfsServer]:
+    monkeypatch.setenv('P4SUBMODULE_CACHE_DIR', str(tmp_path / 'cache'))
+    # Keep the user's credential helpers out of the way
+    monkeypatch.setenv('GIT_CONFIG_GLOBAL', str(tmp_path / 'gitconfig'))
+    monkeypatch.setenv('GIT_CONFIG_NOSYSTEM', '1')
+
+    server = _LfsServer(('localhost', 0), _LfsHandler)
+    server.objects = {hashlib.sha256(CONTENTS).hexdigest(): CONTENTS}
+    server.authorization = None
+    server.batch_requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _lfs_commit(tmp_path: Path, server: _LfsServer, contents: bytes = CONTENTS) -> tuple[pygit2.Repository, pygit2.Oid]:
+    pointer = LfsPointer(hashlib.sha256(contents).hexdigest(), len(contents))
+    return _commit(tmp_path, f'[lfs]\n\turl = http://localhost:{server.server_port}/\n', {
+        '.gitattributes': b'*.bin filter=lfs diff=lfs merge=lfs -text\n',
+        'a.bin': pointer.encode(),
+        'a.txt': b'not tracked by LFS\n',
+    })
+
+def _checkout(repo: pygit2.Repository, commit: pygit2.Oid) -> None:
+    repo.checkout_tree(repo[commit], strategy=CheckoutStrategy.FORCE)
+
+def test_fetch_and_smudge(tmp_path: Path, server: _LfsServer) -> None:
+    repo, commit = _lfs_commit(tmp_path, server)
+    assert lfs.fetch(repo, commit, 'https://example.com/team/repo.git') == (1, len(CONTENTS))
+    assert lfs.missing(repo, commit) == {}
+
+    _checkout(repo, commit)
+    assert (Path(repo.workdir) / 'a.bin').read_bytes() == CONTENTS
+    assert (Path(repo.workdir) / 'a.txt').read_bytes() == b'not tracked by LFS\n'
+
+    # Objects already in the shared store aren't asked for again
+    assert lfs.fetch(repo, commit, 'https://example.com/team/repo.git') == (0, 0)
+    assert server.batch_requests == 1
+
+def test_missing_object(tmp_path: Path, server: _LfsServer) -> None:
+    repo, commit = _lfs_commit(tmp_path, server, b'never uploaded\n')
+    with pytest.raises(Exception, match='Object does not exist'):
+        lfs.fetch(repo, commit, 'https://example.com/team/repo.git')
+
+    # Objects that aren't available are checked out as their pointers
+    _checkout(repo, commit)
+    assert LfsPointer.parse((Path(repo.workdir) / 'a.bin').read_bytes()) is not None
+
+def test_unauthorized(tmp_path: Path, server: _LfsServer) -> None:
+    server.authorization = 'Basic ' + base64.b64encode(b'user:secret').decode()
+    repo, commit = _lfs_commit(tmp_path, server)
+    with pytest.raises(LfsAuthenticationError, match='401'):
+        lfs.fetch(repo, commit, 'https://example.com/team/repo.git')
+    assert lfs.missing(repo, commit)
+
+def test_credential_helper(tmp_path: Path, server: _LfsServer, monkeypatch: pytest.MonkeyPatch) -> None:
+    server.authorization = 'Basic ' + base64.b64encode(b'user:secret').decode()
+    monkeypatch.setenv('GIT_CONFIG_COUNT', '1')
+    monkeypatch.setenv('GIT_CONFIG_KEY_0', 'credential.helper')
+    monkeypatch.setenv('GIT_CONFIG_VALUE_0', '!f() { echo username=user; echo password=secret; }; f')
+
+    repo, commit = _lfs_commit(tmp_path, server)
+    assert lfs.fetch(repo, commit, 'https://example.com/team/repo.git') == (1, len(CONTENTS))
+    # The first request goes without credentials, the retry has the helper's
+    assert server.batch_requests == 2
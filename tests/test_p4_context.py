@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import ntpath
+import os
+from pathlib import Path
+
+import pytest
+
+from p4submodule import p4_context
+from p4submodule.p4_context import P4Context, P4Path, p4_escape, p4_unescape
+
+@pytest.mark.parametrize('path, escaped', [
+    ('Source/a.cpp', 'Source/a.cpp'),
+    ('Docs/100%.md', 'Docs/100%25.md'),
+    ('Art/icon@2x.png', 'Art/icon%402x.png'),
+    ('Notes/#1.txt', 'Notes/%231.txt'),
+    ('Glob/*.txt', 'Glob/%2A.txt'),
+    # % is escaped first, so existing escapes in names survive the round trip
+    ('Odd/%40.txt', 'Odd/%2540.txt'),
+])
+def test_escape(path: str, escaped: str) -> None:
+    assert p4_escape(path) == escaped
+    assert p4_unescape(escaped) == path
+
+class _WhereP4(P4Context):
+    """Answers `p4 where` for a client whose root is spelled differently (like an AltRoot), without a server"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.__dict__['calls'] = []
+
+    def run_where(self, *paths: str) -> list[dict[str, str]]:
+        self.calls.append(paths)
+        return [{'path': f'/altroot/{os.path.basename(path)}', 'depotFile': f'//depot/{os.path.basename(path)}'}
+                for path in paths if 'unmapped' not in path]
+
+def test_where_caches_by_normcased_path(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Windows compares paths case-insensitively
+    monkeypatch.setattr(p4_context.os.path, 'normcase', ntpath.normcase)
+    p4 = _WhereP4()
+
+    assert p4.where(Path('/ws/Source/A.txt'), Path('/ws/Source/B.txt')) == [P4Path('//depot/A.txt'), P4Path('//depot/B.txt')]
+    # The server is sent the paths as they were given, not their normcased keys
+    assert p4.calls == [(os.path.abspath('/ws/Source/A.txt'), os.path.abspath('/ws/Source/B.txt'))]
+
+    assert p4.where(Path('/ws/source/a.txt')) == [P4Path('//depot/A.txt')]
+    assert len(p4.calls) == 1
+
+def test_where_unmapped() -> None:
+    p4 = _WhereP4()
+    with pytest.raises(Exception, match='is not mapped'):
+        p4.where(Path('/ws/a.txt'), Path('/ws/unmapped.txt'), Path('/ws/b.txt'))
+    # The mapped paths are still matched to the right results
+    assert p4.where(Path('/ws/b.txt'), Path('/ws/a.txt')) == [P4Path('//depot/b.txt'), P4Path('//depot/a.txt')]
+
+class _HaveP4(P4Context):
+    """Answers `p4 have` with a fixed set of revisions, without a server"""
+
+    def __init__(self, revisions: dict[str, str]) -> None:
+        super().__init__()
+        self.__dict__['revisions'] = revisions
+
+    def run_have(self, *args: str) -> list[dict[str, str]]:
+        return [{'depotFile': path, 'haveRev': revision} for path, revision in self.revisions.items()]
+
+def test_have_state() -> None:
+    state = _HaveP4({'//depot/a.txt': '1', '//depot/b.txt': '2'}).have_state(P4Path('//ws/A'))
+    # The server's ordering doesn't matter, only the revisions do
+    assert _HaveP4({'//depot/b.txt': '2', '//depot/a.txt': '1'}).have_state(P4Path('//ws/A')) == state
+    assert _HaveP4({'//depot/a.txt': '1', '//depot/b.txt': '3'}).have_state(P4Path('//ws/A')) != state
+    assert _HaveP4({'//depot/a.txt': '1'}).have_state(P4Path('//ws/A')) != state
@@ -0,0 +1,55 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+from p4submodule.path_filter import PathFilter
+
+@pytest.mark.parametrize('pattern, path, expected', [
+    # Patterns without a / match at any depth
+    ('*.md', 'README.md', True),
+    ('*.md', 'Docs/Guide/intro.md', True),
+    ('*.md', 'README.mdx', False),
+    # Patterns with a / are anchored to the submodule's root
+    ('Source/*.h', 'Source/a.h', True),
+    ('Source/*.h', 'Plugin/Source/a.h', False),
+    ('/Docs', 'Docs/a.md', True),
+    ('/Docs', 'Plugin/Docs/a.md', False),
+    # * and ? don't match /
+    ('Source/*.h', 'Source/Private/a.h', False),
+    ('a?.txt', 'ab.txt', True),
+    ('a?.txt', 'a/.txt', False),
+    # **/ matches any number of directories (including none), ** matches anything
+    ('**/Tests', 'Tests/a.cpp', True),
+    ('**/Tests', 'Source/Module/Tests/a.cpp', True),
+    ('Source/**/*.h', 'Source/a.h', True),
+    ('Source/**/*.h', 'Source/Public/Math/a.h', True),
+    ('Source/**', 'Source/Public/a.h', True),
+    ('Source/**', 'Other/a.h', False),
+    # Directories match everything under them
+    ('Docs', 'Docs/Guide/intro.md', True),
+    ('Docs', 'Docsite/index.html', False),
+    # A trailing / only matches directories
+    ('Docs/', 'Docs/a.md', True),
+    ('Docs/', 'Plugin/Docs/a.md', True),
+    ('Docs/', 'Docs', False),
+    ('Docs/', 'Plugin/Docs', False),
+    ('Docs', 'Docs', True),
+])
+def test_pattern(pattern: str, path: str, expected: bool) -> None:
+    assert PathFilter(include=[pattern]).matches(path) == expected
+
+def test_exclude_wins_over_include() -> None:
+    path_filter = PathFilter(include=['Source/', 'Content/'], exclude=['**/Tests/', '*.psd'])
+    assert path_filter.matches('Source/a.cpp')
+    assert path_filter.matches('Content/a.uasset')
+    assert not path_filter.matches('Source/Tests/a.cpp')
+    assert not path_filter.matches('Content/Art/a.psd')
+    assert not path_filter.matches('README.md')
+
+def test_empty_filter_matches_everything() -> None:
+    assert not PathFilter()
+    assert not PathFilter(include=['/', ''])
+    assert PathFilter().matches('any/path.txt')
+    assert PathFilter(exclude=['Docs/']).matches('README.md')
@@ -0,0 +1,57 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+from pathlib import Path
+
+import pytest
+
+from p4submodule import state
+from p4submodule.state import ConfigState, SubmoduleState
+
+@pytest.fixture
+def config_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setenv('P4SUBMODULE_CACHE_DIR', str(tmp_path / 'cache'))
+    path = tmp_path / 'submodule.toml'
+    path.write_text('remote = "https://example.com/repo.git"\ntracking = "main"\n')
+    return path
+
+def _save(config_path: Path) -> None:
+    stamp = state.stamp(config_path)
+    submodules = [SubmoduleState(name='A', remote='https://example.com/repo.git', tracking='main', include=['Source/'])]
+    state.save(config_path, ConfigState(stamp.mtime_ns, stamp.size, stamp.digest, submodules))
+
+def test_round_trip(config_path: Path) -> None:
+    _save(config_path)
+    loaded = state.load(config_path)
+    assert loaded is not None
+    assert loaded.submodules[0].include == ['Source/']
+
+def test_missing(config_path: Path) -> None:
+    assert state.load(config_path) is None
+
+def test_touched_but_unchanged(config_path: Path) -> None:
+    _save(config_path)
+    info = config_path.stat()
+    os.utime(config_path, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+    loaded = state.load(config_path)
+    assert loaded is not None
+    assert loaded.mtime_ns == info.st_mtime_ns + 10**9
+
+def test_changed_size(config_path: Path) -> None:
+    _save(config_path)
+    config_path.write_text(config_path.read_text() + 'depth = 1\n')
+    assert state.load(config_path) is None
+
+def test_changed_same_size(config_path: Path) -> None:
+    _save(config_path)
+    info = config_path.stat()
+    config_path.write_text(config_path.read_text().replace('main', 'dev1'))
+    os.utime(config_path, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+    assert state.load(config_path) is None
+
+def test_corrupt(config_path: Path) -> None:
+    _save(config_path)
+    state._state_path(config_path).write_bytes(b'not msgpack')
+    assert state.load(config_path) is None
@@ -0,0 +1,225 @@
+# SPDX-FileCopyrightText: © 2025 Secret Dimension, Inc. <info@secretdimension.com>. All Rights Reserved.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+
+import pygit2
+import pytest
+from pygit2.enums import FileMode, FileStatus, ObjectType
+
+from p4submodule.config_file import ConfigFile
+from p4submodule.p4_context import P4Context
+from p4submodule.submodule import FetchOptions, PendingUpdate, Submodule
+
+OPTIONS = FetchOptions(show_progress=False, lfs=False)
+
+BASE = {
+    'a.txt': b'a\n',
+    'b.txt': b'moved without changes\n' * 10,
+    'c.txt': b'c\n',
+    'Docs/e.md': b'e\n',
+    'same.txt': b'never changes\n',
+}
+
+# An upstream commit with an edit, a move, a delete and an add
+UPSTREAM = {
+    'a.txt': b'a, edited upstream\n',
+    'Docs/b.txt': BASE['b.txt'],
+    'Docs/e.md': BASE['Docs/e.md'],
+    'd.txt': b'added upstream\n',
+    'same.txt': BASE['same.txt'],
+}
+
+class _FakeP4(P4Context):
+    """A client named ws rooted at root, without a server"""
+
+    def __init__(self, root: Path) -> None:
+        super().__init__()
+        self.client = 'ws'
+        self.__dict__['root'] = root
+
+    def _fetch_client_root(self) -> Path:
+        return self.root
+
+    def run_opened(self, *args: str) -> list[dict[str, str]]:
+        return []
+
+    def run_have(self, *args: str) -> list[dict[str, str]]:
+        return []
+
+class _Workspace(object):
+    """A submodule cloned from a local bare repository into a P4 workspace"""
+
+    remote: pygit2.Repository
+
+    module: Submodule
+
+    base: pygit2.Oid
+    """The commit the submodule was cloned at (its current_ref)"""
+
+    def __init__(self, root: Path) -> None:
+        self.remote = pygit2.init_repository(root / 'remote.git', bare=True, initial_head='main')
+        self.base = self.push(BASE)
+
+        config = ConfigFile(root / 'ws' / 'Plugins' / 'submodule.toml', _FakeP4(root / 'ws'))
+        self.module = config.add_submodule('A', root / 'ws' / 'Plugins' / 'A')
+        self.module.remote = urlparse(self.remote.path)
+        self.module.tracking = 'main'
+        self.module.current_ref = self.base
+
+        repo = pygit2.clone_repository(self.remote.path, str(self.module.local_path))
+        repo.config['user.name'] = 'Test'
+        repo.config['user.email'] = 'test@example.com'
+
+    def push(self, files: dict[str, bytes]) -> pygit2.Oid:
+        """Commit files as the whole tree of the remote's main branch"""
+        index = pygit2.Index()
+        for path, data in files.items():
+            index.add(pygit2.IndexEntry(path, self.remote.create_blob(data), FileMode.BLOB))
+        parents = [self.remote.head.target] if not self.remote.head_is_unborn else []
+        signature = pygit2.Signature('Test', 'test@example.com')
+        return self.remote.create_commit('refs/heads/main', signature, signature, 'upstream', index.write_tree(self.remote), parents)
+
+    def path(self, path: str) -> Path:
+        return self.module.local_path / path
+
+    def ws(self, path: str) -> str:
+        return f'//ws/Plugins/A/{path}'
+
+    def prepare(self, commit_message: Optional[str] = None) -> PendingUpdate:
+        pending = self.module.prepare_update(commit_message, OPTIONS)
+        assert pending is not None
+        return pending
+
+@pytest.fixture
+def workspace(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> _Workspace:
+    monkeypatch.setenv('P4SUBMODULE_CACHE_DIR', str(tmp_path / 'cache'))
+    # Keep the user's git config out of the way
+    monkeypatch.setenv('GIT_CONFIG_GLOBAL', str(tmp_path / 'gitconfig'))
+    monkeypatch.setenv('GIT_CONFIG_NOSYSTEM', '1')
+    return _Workspace(tmp_path.resolve())
+
+def test_changes(workspace: _Workspace) -> None:
+    workspace.push(UPSTREAM)
+    changes = workspace.prepare().changes
+
+    assert list(changes.edits) == [workspace.ws('a.txt')]
+    assert changes.moves == {workspace.ws('b.txt'): workspace.ws('Docs/b.txt')}
+    assert list(changes.deletes) == [workspace.ws('c.txt')]
+    assert list(changes.adds) == [workspace.ws('d.txt')]
+
+def test_changes_include_local_changes(workspace: _Workspace) -> None:
+    workspace.push(UPSTREAM)
+    # Not opened in P4, but the first update after cloning checks every file
+    workspace.path('Docs/e.md').write_bytes(b'e, edited locally\n')
+    workspace.path('local.txt').write_bytes(b'added locally\n')
+    changes = workspace.prepare('local').changes
+
+    assert sorted(changes.edits) == [workspace.ws('Docs/e.md'), workspace.ws('a.txt')]
+    assert sorted(changes.adds) == [workspace.ws('d.txt'), workspace.ws('local.txt')]
+
+def test_changes_left_out_by_the_path_filter(workspace: _Workspace) -> None:
+    workspace.module.exclude = ['Docs/']
+    workspace.push(UPSTREAM)
+    changes = workspace.prepare().changes
+
+    # The move out of the filtered files becomes a delete
+    assert changes.moves == {}
+    assert sorted(changes.deletes) == [workspace.ws('b.txt'), workspace.ws('c.txt')]
+
+def _age(path: Path) -> int:
+    """Push back a file's mtime, so a rewrite of it is noticed"""
+    mtime = path.stat().st_mtime_ns - 10**10
+    os.utime(path, ns=(mtime, mtime))
+    return mtime
+
+def _tree(workspace: _Workspace) -> dict[str, bytes]:
+    root = workspace.module.local_path
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in root.rglob('*') if path.is_file() and '.git' not in path.parts}
+
+def test_apply_writes_only_the_changes(workspace: _Workspace) -> None:
+    target = workspace.push(UPSTREAM)
+    unchanged = _age(workspace.path('same.txt'))
+
+    pending = workspace.prepare()
+    # Nothing is written until the update is applied
+    assert _tree(workspace) == BASE
+
+    workspace.module.apply_update(pending)
+    assert _tree(workspace) == UPSTREAM
+    assert workspace.path('same.txt').stat().st_mtime_ns == unchanged
+
+    repo = pygit2.Repository(str(workspace.module.local_path))
+    assert repo.head.target == target
+    assert repo.status() == {}
+    assert workspace.module.current_ref == target
+
+def test_rollback_writes_only_the_changes(workspace: _Workspace) -> None:
+    workspace.push(UPSTREAM)
+    pending = workspace.prepare()
+    workspace.module.apply_update(pending)
+    unchanged = _age(workspace.path('same.txt'))
+
+    workspace.module.rollback_update(pending)
+    assert _tree(workspace) == BASE
+    assert workspace.path('same.txt').stat().st_mtime_ns == unchanged
+
+    repo = pygit2.Repository(str(workspace.module.local_path))
+    assert repo.head.target == workspace.base
+    assert repo.status() == {}
+    assert workspace.module.current_ref == workspace.base
+
+def _commit_locally(workspace: _Workspace, path: str, data: bytes) -> pygit2.Oid:
+    repo = pygit2.Repository(str(workspace.module.local_path))
+    workspace.path(path).write_bytes(data)
+    repo.index.add(path)
+    repo.index.write()
+    return repo.create_commit('HEAD', repo.default_signature, repo.default_signature, f'edit {path}', repo.index.write_tree(), [repo.head.target])
+
+def test_rebase_local_changes(workspace: _Workspace) -> None:
+    target = workspace.push(UPSTREAM)
+    _commit_locally(workspace, 'same.txt', b'committed locally\n')
+    workspace.path('Docs/e.md').write_bytes(b'e, edited locally\n')
+    local = {**BASE, 'same.txt': b'committed locally\n', 'Docs/e.md': b'e, edited locally\n'}
+
+    pending = workspace.prepare('local')
+    # The commits are replayed without touching the working tree
+    assert _tree(workspace) == local
+    assert len(pending.local_commits) == 2
+
+    repo = pygit2.Repository(str(workspace.module.local_path))
+    head = repo[pending.head].peel(pygit2.Commit)
+    assert head.parents[0].parents[0].id == target
+
+    workspace.module.apply_update(pending)
+    assert _tree(workspace) == {**UPSTREAM, 'same.txt': b'committed locally\n', 'Docs/e.md': b'e, edited locally\n'}
+    assert repo.status() == {}
+
+def test_rebase_conflict(workspace: _Workspace) -> None:
+    workspace.push(UPSTREAM)
+    workspace.path('a.txt').write_bytes(b'a, edited locally\n')
+
+    with pytest.raises(Exception, match='conflicts with the remote in: a.txt'):
+        workspace.prepare('local')
+
+    # The local change is uncommitted again, and nothing else was written
+    assert _tree(workspace) == {**BASE, 'a.txt': b'a, edited locally\n'}
+    repo = pygit2.Repository(str(workspace.module.local_path))
+    assert repo.head.target == workspace.base
+    assert repo.status() == {'a.txt': FileStatus.WT_MODIFIED}
+
+def test_fetch_only_the_tracking_branch(workspace: _Workspace) -> None:
+    target = workspace.push(UPSTREAM)
+    signature = pygit2.Signature('Test', 'test@example.com')
+    workspace.remote.create_branch('other', workspace.remote[target].peel(pygit2.Commit))
+    workspace.remote.create_tag('v1', target, ObjectType.COMMIT, signature, 'v1')
+
+    workspace.prepare()
+    repo = pygit2.Repository(str(workspace.module.local_path))
+    assert repo.references.get('refs/remotes/origin/main').target == target
+    assert 'refs/remotes/origin/other' not in repo.references
+    assert 'refs/tags/v1' not in repo.references